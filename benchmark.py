@@ -0,0 +1,536 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import lunar_lockout
+import moving_pieces
+import tilt
+from lunar_lockout import LunarLockout
+from compact_set import CompactSet
+from moving_pieces import MovingPieces
+from parallel import MIN_CHUNK_SIZE, parallel_bfs, solve_batch
+from solver import ENGINES, GameClass, solve
+from tilt import Tilt
+
+GAMES: List[GameClass] = [LunarLockout, MovingPieces, Tilt]
+
+# Engines compared on every puzzle; dfs is left out
+# because its solutions are not shortest.
+COMPARED_ENGINES = ['bfs', 'astar', 'idastar']
+
+# Engines run on every puzzle by run_suite when the game supports them.
+# tablebase is left out because it needs files built beforehand.
+SUITE_ENGINES = ['bfs', 'bidirectional', 'astar', 'idastar', 'dfs']
+
+# Times reported by run_suite are the fastest of this many runs.
+TIME_REPEATS = 3
+
+# How much worse than a baseline a result of run_suite may be
+# before compare_results reports it as a regression.
+# Times below MIN_SECONDS are too noisy to compare, and a total
+# that is slower is timed TIME_CHECKS more times and only reported
+# if it is slower every time.
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+MIN_SECONDS = 0.5
+TIME_CHECKS = 2
+
+# Keys of every result in a file saved by run_suite.
+RESULT_KEYS = {'game', 'engine', 'seconds', 'expanded', 'peak_bytes',
+               'solution_length'}
+
+# A result of run_suite for one puzzle, game and engine,
+# or a total over all the puzzles of a game for one engine.
+SuiteResult = Dict[str, Any]
+
+# Random puzzles solved for each board size by compare_board_sizes.
+PUZZLES_PER_SIZE = 20
+
+# Length of the random walks that make Moving Pieces puzzles.
+WALK_LENGTH = 5000
+
+
+def _random_lunar_lockout(rng: random.Random) -> Any:
+    """Make a Lunar Lockout puzzle with the red robot and four helpers
+    in random cells of the current board size.
+    It may not have a solution."""
+    cells = rng.sample(range(lunar_lockout.SIZE ** 2), 5)
+    while cells[0] == lunar_lockout.CENTER_CELL:
+        cells = rng.sample(range(lunar_lockout.SIZE ** 2), 5)
+    cells.append(lunar_lockout.ABSENT)
+    return sum(cell << (i * lunar_lockout.CELL_BITS)
+               for i, cell in enumerate(cells))
+
+
+def _random_moving_pieces(rng: random.Random) -> Any:
+    """Make a Moving Pieces puzzle for the current board size
+    by taking random moves from a solved State,
+    keeping the State whose pinned pieces are furthest from their targets.
+    On the default board so few cells are empty that random moves
+    rarely move piece A, so its first bundled puzzle is used instead."""
+    if MovingPieces.board_size() == (5, 4):
+        return MovingPieces.load_puzzles()[1]
+    state = best = rng.choice(MovingPieces.get_solved_states())
+    for _ in range(WALK_LENGTH):
+        action = rng.choice(MovingPieces.get_possible_actions(state))
+        state = MovingPieces.take_action(state, action, validate=False)
+        if MovingPieces.heuristic(state) > MovingPieces.heuristic(best):
+            best = state
+    return best
+
+
+def _random_tilt(rng: random.Random) -> Any:
+    """Make a Tilt puzzle with two blockers, two green pieces
+    and a blue piece in random cells of the current board size.
+    It may not have a solution."""
+    size = tilt.SIZE
+    board = [[' '] * size for _ in range(size)]
+    board[tilt.CENTER][tilt.CENTER] = tilt.TARGET
+    cells = [cell for cell in range(size * size)
+             if cell != tilt.CENTER * size + tilt.CENTER]
+    for piece, cell in zip('XXGGB', rng.sample(cells, 5)):
+        board[cell // size][cell % size] = piece
+    return tilt.pack_board(board)
+
+
+def compare_board_sizes(
+        game: GameClass,
+        set_size: Callable[..., None],
+        sizes: List[Tuple[int, ...]],
+        make_puzzle: Callable[[random.Random], Any],
+        count: int = PUZZLES_PER_SIZE) -> None:
+    """Print the average time and number of nodes expanded
+    to solve random puzzles of a game with each board size,
+    changing the size with set_size and restoring it afterward."""
+    default = game.board_size()
+    print('\n' + game.__name__)
+    for size in sizes:
+        start = time.perf_counter()
+        set_size(*size)
+        table_seconds = time.perf_counter() - start
+        rng = random.Random(0)
+        puzzles = [make_puzzle(rng) for _ in range(count)]
+        solved = expanded = 0
+        start = time.perf_counter()
+        for state in puzzles:
+            solution, stats = solve(state, game)
+            solved += solution is not None
+            expanded += stats['expanded']
+        seconds = time.perf_counter() - start
+        columns, rows = game.board_size()
+        print(f'{columns}x{rows}: {seconds / count:>8.3f} seconds/puzzle,'
+              f' {expanded / count:>11,.0f} expanded/puzzle,'
+              f' {solved}/{count} solvable,'
+              f' tables built in {table_seconds:.3f} seconds')
+    set_size(*default[:len(sizes[0])])
+
+
+def run_suite(
+        games: List[GameClass] = GAMES,
+        engine_names: List[str] = SUITE_ENGINES) -> Dict[str, Any]:
+    """Solve every puzzle of each game with each engine it supports
+    and return a description of the results that can be saved as JSON.
+    Each result holds the wall time, the nodes expanded,
+    the moves generated and their rate, the peak memory allocated
+    while solving and the solution length (None if there is none).
+    Times come from the fastest of TIME_REPEATS plain runs; the moves
+    and memory are measured in another run because counting and tracing
+    slow the search."""
+    results = []
+    totals = []
+    for game in games:
+        for name in engine_names:
+            if name == 'bidirectional' \
+                    and not hasattr(game, 'get_solved_states'):
+                continue
+            total: SuiteResult = {
+                'game': game.__name__, 'engine': name, 'seconds': 0.0,
+                'expanded': 0, 'moves': 0, 'peak_bytes': 0,
+                'solution_length': 0}
+            for number, state in game.load_puzzles().items():
+                seconds, (solution, stats) = _time_engine(name, state, game)
+
+                counts = {'moves': 0}
+                game.initialize()
+                tracemalloc.start()
+                ENGINES[name](state, _counting_game(game, counts))
+                _, peak_bytes = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                length = None if solution is None else len(solution)
+                results.append({
+                    'game': game.__name__,
+                    'engine': name,
+                    'puzzle': number,
+                    'seconds': seconds,
+                    'expanded': stats['expanded'],
+                    'moves': counts['moves'],
+                    'moves_per_second': counts['moves'] / seconds,
+                    'peak_bytes': peak_bytes,
+                    'solution_length': length
+                })
+                total['seconds'] += seconds
+                total['expanded'] += stats['expanded']
+                total['moves'] += counts['moves']
+                total['peak_bytes'] = max(total['peak_bytes'], peak_bytes)
+                total['solution_length'] += length or 0
+            total['moves_per_second'] = total['moves'] / total['seconds']
+            totals.append(total)
+
+    return {
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+        'totals': totals
+    }
+
+
+def time_total(game_name: str, engine_name: str) -> float:
+    """Time an engine again on every puzzle of a game named
+    as in the results of run_suite and get the total seconds."""
+    game = next(candidate for candidate in GAMES
+                if candidate.__name__ == game_name)
+    return sum(_time_engine(engine_name, state, game)[0]
+               for state in game.load_puzzles().values())
+
+
+def reachable_states(game: GameClass) -> List[Any]:
+    """Get every State reachable from any puzzle of a game."""
+    states = []
+    seen = set()
+    for state in game.load_puzzles().values():
+        game.initialize()
+        pending = [state]
+        while pending:
+            state = pending.pop()
+            key = game.state_key(state)
+            if key in seen:
+                continue
+            seen.add(key)
+            states.append(state)
+            for action in game.get_possible_actions(state):
+                pending.append(game.take_action(state, action, validate=False))
+    return states
+
+
+def move_throughput(game: GameClass, states: List[Any]) -> float:
+    """Get the number of moves per second a game finds and takes
+    from a list of States."""
+    moves = 0
+    start = time.perf_counter()
+    for state in states:
+        for action in game.get_possible_actions(state):
+            game.take_action(state, action, validate=False)
+            moves += 1
+    return moves / (time.perf_counter() - start)
+
+
+def compare_parallel_bfs(
+        game: GameClass, state: Any, worker_counts: List[int]) -> None:
+    """Print the speedup of parallel_bfs with each number of workers
+    over the single-process breadth-first search for one puzzle.
+    Only layers of at least MIN_CHUNK_SIZE States are sent to the workers,
+    so the puzzle should have wider layers than that."""
+    start = time.perf_counter()
+    _, stats = solve(state, game)
+    base = time.perf_counter() - start
+    print(f'{game.__name__} single process: {base:.3f} seconds,'
+          f' widest layer {stats["peak_frontier"]:,} States'
+          f' (chunks of at least {MIN_CHUNK_SIZE})')
+    for workers in worker_counts:
+        start = time.perf_counter()
+        parallel_bfs(state, game, workers)
+        seconds = time.perf_counter() - start
+        print(f'{game.__name__} parallel_bfs with {workers} workers: '
+              f'{seconds:.3f} seconds, speedup {base / seconds:.2f}')
+
+
+def compare_workers(game: GameClass, worker_counts: List[int]) -> None:
+    """Print the wall time to solve every puzzle of a game
+    with a batch of worker processes of each size."""
+    puzzles = game.load_puzzles()
+    for workers in worker_counts:
+        start = time.perf_counter()
+        for _ in solve_batch(game, puzzles, workers=workers):
+            pass
+        seconds = time.perf_counter() - start
+        print(f'{game.__name__} with {workers} workers: {seconds:.3f} seconds')
+
+
+def compare_keys(game: GameClass, states: List[Any]) -> None:
+    """Print how long computing the state_string and the state_key
+    of a list of States takes and how much memory a set of them uses."""
+    for method in (game.state_string, game.state_key):
+        start = time.perf_counter()
+        keys = set(map(method, states))
+        seconds = time.perf_counter() - start
+        key_size = sum(map(sys.getsizeof, keys)) / len(keys)
+        set_size = sys.getsizeof(keys) / len(keys)
+        print(f'{method.__name__:>12}: '
+              f'{seconds / len(states) * 1e9:>8,.0f} ns/State, '
+              f'{key_size:>5.1f} bytes/key + {set_size:.1f} bytes/set entry')
+
+
+def compare_visited_sets(game: GameClass, states: List[Any]) -> None:
+    """Print how long adding the keys of a list of States to a set
+    and to a CompactSet takes and how much memory each uses per key."""
+    keys = list(map(game.state_key, states))
+    start = time.perf_counter()
+    plain = set(keys)
+    set_seconds = time.perf_counter() - start
+    set_bytes = sys.getsizeof(plain) + sum(map(sys.getsizeof, plain))
+
+    start = time.perf_counter()
+    compact = CompactSet()
+    for key in keys:
+        compact.add(key)
+    compact_seconds = time.perf_counter() - start
+    compact_bytes = compact.memory_bytes()
+
+    for name, seconds, size in (('set', set_seconds, set_bytes),
+                                ('CompactSet', compact_seconds,
+                                 compact_bytes)):
+        print(f'{name:>12}: {seconds / len(keys) * 1e9:>8,.0f} ns/key, '
+              f'{size / len(keys):>5.1f} bytes/key')
+
+
+def _counting_game(game: GameClass, counts: Dict[str, int]) -> GameClass:
+    """Make a subclass of a game that adds the number of Actions
+    each call of get_possible_actions returns to counts['moves']."""
+
+    class Counting(game):  # type: ignore
+        @staticmethod
+        def get_possible_actions(state: Any) -> List[Any]:
+            actions = game.get_possible_actions(state)
+            counts['moves'] += len(actions)
+            return actions
+
+    Counting.__name__ = game.__name__
+    return Counting
+
+
+def _time_engine(
+        name: str, state: Any, game: GameClass) -> Tuple[float, Any]:
+    """Solve a puzzle TIME_REPEATS times with an engine
+    and get the fastest time and the Result."""
+    seconds = math.inf
+    for _ in range(TIME_REPEATS):
+        game.initialize()
+        start = time.perf_counter()
+        result = ENGINES[name](state, game)
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds, result
+
+
+def compare_results(
+        results: Dict[str, Any],
+        baseline: Dict[str, Any],
+        retime: Optional[Callable[[str, str], float]] = None) -> List[str]:
+    """Compare the output of run_suite with a saved baseline
+    and describe each regression: a longer solution, more nodes expanded
+    or more peak memory for any puzzle, or more time for any engine
+    over all the puzzles of a game.
+    If retime is given, it is called with the names of a game and
+    an engine to time a total again before it is reported as slower."""
+    def key(result: SuiteResult) -> Tuple[str, str, Any]:
+        return result['game'], result['engine'], result.get('puzzle')
+
+    def length(result: SuiteResult) -> float:
+        # Finding no solution is worse than a solution of any length.
+        value = result['solution_length']
+        return math.inf if value is None else value
+
+    old = {key(result): result for result in
+           baseline['results'] + baseline['totals']}
+    regressions = []
+    for result in results['results'] + results['totals']:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        name = '/'.join(str(part) for part in key(result) if part is not None)
+        if length(result) > length(before):
+            regressions.append(
+                f'{name}: solution length {before["solution_length"]}'
+                f' -> {result["solution_length"]}')
+        if result['expanded'] > before['expanded']:
+            regressions.append(
+                f'{name}: expanded {before["expanded"]}'
+                f' -> {result["expanded"]}')
+        if result['peak_bytes'] > \
+                before['peak_bytes'] * (1 + MEMORY_TOLERANCE):
+            regressions.append(
+                f'{name}: peak memory {before["peak_bytes"]:,}'
+                f' -> {result["peak_bytes"]:,} bytes')
+        limit = max(MIN_SECONDS, before['seconds'] * (1 + TIME_TOLERANCE))
+        if 'puzzle' not in result and result['seconds'] > limit \
+                and (retime is None
+                     or all(retime(result['game'], result['engine']) > limit
+                            for _ in range(TIME_CHECKS))):
+            regressions.append(
+                f'{name}: {before["seconds"]:.3f}'
+                f' -> {result["seconds"]:.3f} seconds')
+    return regressions
+
+
+def compare_slides(states: List[int]) -> None:
+    """Print how many Lunar Lockout moves per second are found
+    by bit tricks and by the precomputed slide tables."""
+    robot_cells = []
+    for state in states:
+        rows, columns = lunar_lockout._occupancy(state)
+        for robot_index in range(len(lunar_lockout.robot_ids)):
+            cell = (state >> (robot_index * lunar_lockout.CELL_BITS)) \
+                & lunar_lockout.CELL_MASK
+            if cell != lunar_lockout.ABSENT:
+                robot_cells.append((rows, columns, cell))
+    lookups = len(robot_cells) * len(lunar_lockout.directions)
+
+    start = time.perf_counter()
+    for rows, columns, cell in robot_cells:
+        for direction in lunar_lockout.directions:
+            lunar_lockout._destination(rows, columns, cell, direction)
+    bit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for rows, columns, cell in robot_cells:
+        for _, vertical, shift, stops in lunar_lockout._slides[cell]:
+            _ = stops[((columns if vertical else rows) >> shift)
+                      & lunar_lockout.LANE_MASK]
+    table_seconds = time.perf_counter() - start
+
+    print(f'bit tricks  : {lookups / bit_seconds:>12,.0f} moves/sec')
+    print(f'slide tables: {lookups / table_seconds:>12,.0f} moves/sec')
+
+
+def compare_engines(game: GameClass, engine_names: List[str]) -> None:
+    """Solve every puzzle of a game with each engine and print
+    the number of nodes each engine expanded."""
+    widths = [max(10, len(name) + 2) for name in engine_names]
+    print('\n' + game.__name__)
+    print('puzzle  moves ' + ''.join(
+        f'{name:>{width}}' for name, width in zip(engine_names, widths)))
+
+    totals = [0] * len(engine_names)
+    seconds = [0.0] * len(engine_names)
+    for number, state in game.load_puzzles().items():
+        lengths = set()
+        line = ''
+        for i, name in enumerate(engine_names):
+            game.initialize()
+            start = time.perf_counter()
+            solution, stats = ENGINES[name](state, game)
+            seconds[i] += time.perf_counter() - start
+            lengths.add(None if solution is None else len(solution))
+            totals[i] += stats['expanded']
+            line += f'{stats["expanded"]:>{widths[i]}}'
+        moves = '/'.join(map(str, lengths))  # more than one means a bug
+        print(f'{number:>6} {moves:>6} {line}')
+
+    print('total         ' + ''.join(
+        f'{total:>{width}}' for total, width in zip(totals, widths)))
+    print('seconds       ' + ''.join(
+        f'{s:>{width}.3f}' for s, width in zip(seconds, widths)))
+
+
+def report_all() -> None:
+    """Print every comparison this module makes."""
+    for game_class in GAMES:
+        game_states = reachable_states(game_class)
+        rate = move_throughput(game_class, game_states)
+        print(f'{game_class.__name__}: {len(game_states)} reachable States, '
+              f'{rate:,.0f} moves/sec')
+        compare_keys(game_class, game_states)
+        compare_visited_sets(game_class, game_states)
+        if game_class is LunarLockout:
+            compare_slides(game_states)
+
+    print(f'\n{os.cpu_count()} CPUs')
+    for game_class in (LunarLockout, Tilt):
+        compare_workers(game_class, [1, 2, 4])
+    # The widest layer of the bundled Moving Pieces puzzle is smaller
+    # than MIN_CHUNK_SIZE, so parallel_bfs would never use its workers.
+    # The 6x4 puzzle made from seed 0 expands 439,197 States.
+    moving_pieces.set_size(6, 4)
+    compare_parallel_bfs(
+        MovingPieces, _random_moving_pieces(random.Random(0)), [1, 2, 4, 8])
+    moving_pieces.set_size(5, 4)
+
+    compare_board_sizes(LunarLockout, lunar_lockout.set_size,
+                        [(4,), (5,), (6,), (7,), (8,)], _random_lunar_lockout)
+    compare_board_sizes(Tilt, tilt.set_size,
+                        [(4,), (5,), (6,), (7,)], _random_tilt)
+    compare_board_sizes(MovingPieces, moving_pieces.set_size,
+                        [(5, 4), (6, 4)], _random_moving_pieces, 1)
+
+    for game_class in GAMES:
+        names = COMPARED_ENGINES.copy()
+        if hasattr(game_class, 'get_solved_states'):
+            names.insert(1, 'bidirectional')
+        compare_engines(game_class, names)
+
+
+def _is_suite_output(value: Any) -> bool:
+    """Determine if a value loaded from JSON has the form
+    of the output of run_suite."""
+    return isinstance(value, dict) and all(
+        isinstance(value.get(name), list)
+        and all(isinstance(result, dict) and RESULT_KEYS <= result.keys()
+                for result in value[name])
+        for name in ('results', 'totals'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Measure the games and search engines.')
+    parser.add_argument(
+        '--json', metavar='PATH',
+        help='solve every puzzle with every engine and save the results'
+             ' as JSON instead of printing comparisons')
+    parser.add_argument(
+        '--baseline', metavar='PATH',
+        help='with --json, compare the results with a saved file'
+             ' and exit with status 1 if any are worse')
+    args = parser.parse_args()
+    if not args.json:
+        report_all()
+        return
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as error:
+            parser.error(f'--baseline: {error}')
+        if not _is_suite_output(baseline):
+            parser.error(f'--baseline: {args.baseline} was not saved'
+                         ' by --json')
+
+    results = run_suite()
+    with open(args.json, 'w') as file:
+        json.dump(results, file, indent=2)
+    for total in results['totals']:
+        print(f'{total["game"]:>12} {total["engine"]:>13}:'
+              f' {total["seconds"]:>7.3f} seconds,'
+              f' {total["expanded"]:>7} expanded,'
+              f' {total["moves_per_second"]:>10,.0f} moves/sec,'
+              f' {total["peak_bytes"]:>11,} peak bytes')
+
+    if baseline is not None:
+        regressions = compare_results(results, baseline, time_total)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+from typing import Any, Optional
+from solver import ENGINE_VERSION, GameClass, Result
+
+
+def _game_name(game: GameClass) -> str:
+    """Get the name a game is stored under, which includes its board size
+    because States of different sizes may be equal."""
+    columns, rows = game.board_size()
+    return f'{game.__name__} {columns}x{rows}'
+
+
+class SolutionCache:
+    """Stores the Results of solving puzzles in an SQLite file,
+    keyed by the game and its board size, the search engine
+    and the state_key of the puzzle.
+    Results found by other versions of the engines or the game rules
+    are ignored and removed."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'create table if not exists solutions ('
+            'game text, rules_version integer,'
+            ' engine text, engine_version integer,'
+            ' state_key text, state text, solution text, stats text,'
+            ' primary key (game, engine, state_key))')
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, game: GameClass, engine: str,
+            state: Any) -> Optional[Result]:
+        """Get the stored Result of solving a puzzle, or None if there is
+        none from the current versions of the engine and game rules."""
+        row = self.connection.execute(
+            'select rules_version, engine_version, state, solution, stats'
+            ' from solutions where game = ? and engine = ? and state_key = ?',
+            (_game_name(game), engine, str(game.state_key(state)))).fetchone()
+        if row is None:
+            return None
+
+        rules_version, engine_version, stored_state, solution, stats = row
+        if rules_version != game.RULES_VERSION \
+                or engine_version != ENGINE_VERSION:
+            self.connection.execute(
+                'delete from solutions'
+                ' where game = ? and engine = ? and state_key = ?',
+                (_game_name(game), engine, str(game.state_key(state))))
+            self.connection.commit()
+            return None
+
+        if stored_state != repr(state):
+            # This puzzle shares its key with the one that was solved,
+            # but is different, such as having interchangeable pieces swapped,
+            # so the stored Actions may not apply to it.
+            return None
+
+        # JSON turns the tuples some games use for Actions into lists.
+        solution = json.loads(solution)
+        if solution is not None:
+            solution = [tuple(action) if isinstance(action, list) else action
+                        for action in solution]
+        stats = json.loads(stats)
+        stats['cached'] = 1
+        return solution, stats
+
+    def put(self, game: GameClass, engine: str, state: Any,
+            result: Result) -> None:
+        """Store the Result of solving a puzzle."""
+        solution, stats = result
+        self.connection.execute(
+            'insert or replace into solutions'
+            ' values (?, ?, ?, ?, ?, ?, ?, ?)',
+            (_game_name(game), game.RULES_VERSION, engine, ENGINE_VERSION,
+             str(game.state_key(state)), repr(state),
+             json.dumps(solution), json.dumps(stats)))
+        self.connection.commit()
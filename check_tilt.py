@@ -0,0 +1,90 @@
+"""Checks the Tilt tilt tables against a reference that moves
+one piece one cell at a time, on every board size from 4 to 7.
+Enter `python check_tilt.py`; the exit status is 1 on any mismatch."""
+import random
+import sys
+from typing import List, Optional
+import tilt
+from share import direction_deltas, directions
+from tilt import Board, Tilt
+
+SIZES = [4, 5, 6, 7]
+
+# Random boards checked at each size, each tilted in every direction.
+BOARDS_PER_SIZE = 3000
+
+
+def reference_tilt(board: Board, direction: str) -> Optional[Board]:
+    """Tilt a Board by moving one piece one cell at a time
+    until none can move, or return None if a blue piece
+    would fall in the hole.
+    Green pieces that reach the hole fall in and are removed."""
+    size = len(board)
+    board = [row[:] for row in board]
+    dx, dy = direction_deltas[direction]
+    moved = True
+    while moved:
+        moved = False
+        for row in range(size):
+            for column in range(size):
+                piece = board[row][column]
+                if piece not in ('G', 'B'):
+                    continue
+                next_row, next_column = row + dy, column + dx
+                if not (0 <= next_row < size and 0 <= next_column < size):
+                    continue
+                ahead = board[next_row][next_column]
+                if ahead == tilt.TARGET:
+                    if piece == 'B':
+                        return None
+                    board[row][column] = ' '
+                    moved = True
+                elif ahead == ' ':
+                    board[next_row][next_column] = piece
+                    board[row][column] = ' '
+                    moved = True
+    return board
+
+
+def _random_board(rng: random.Random, size: int) -> Board:
+    """Make a Board with random pieces around the hole."""
+    board = [[rng.choice(tilt.pieces) for _ in range(size)]
+             for _ in range(size)]
+    board[tilt.CENTER][tilt.CENTER] = tilt.TARGET
+    return board
+
+
+def check_size(size: int, count: int = BOARDS_PER_SIZE) -> List[str]:
+    """Compare Tilt.take_action with reference_tilt on random boards
+    of one size and describe each mismatch."""
+    tilt.set_size(size)
+    Tilt.initialize()
+    rng = random.Random(size)
+    mismatches = []
+    for _ in range(count):
+        board = _random_board(rng, size)
+        state = tilt.pack_board(board)
+        for direction in directions:
+            expected = reference_tilt(board, direction)
+            actual = tilt.unpack_board(Tilt.take_action(state, direction))
+            if actual != (board if expected is None else expected):
+                mismatches.append(f'{size}x{size} {board} {direction}')
+    return mismatches
+
+
+def main() -> None:
+    default = Tilt.board_size()[0]
+    failed = False
+    for size in SIZES:
+        mismatches = check_size(size)
+        print(f'{size}x{size}: {len(mismatches)} mismatches'
+              f' in {4 * BOARDS_PER_SIZE} tilts')
+        for mismatch in mismatches[:3]:
+            print('  ' + mismatch)
+        failed = failed or bool(mismatches)
+    tilt.set_size(default)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+from array import array
+from typing import Dict, Optional
+
+# Keys are stored plus one in KEY_BITS-bit slots
+# so that zero marks an empty slot.
+KEY_BITS = 64
+EMPTY = 0
+MAX_KEY = (1 << KEY_BITS) - 2
+
+# Multipliers that spread the bits of a key for hashing.
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+SECOND_MULTIPLIER = 0xC2B2AE3D27D4EB4F
+HASH_MASK = (1 << 64) - 1
+
+# A table grows when it is more than this fraction full.
+MAX_LOAD = 2 / 3
+
+# Bytes of the Bloom filter when there is no max_bytes to take it from.
+BLOOM_BYTES = 1 << 24
+
+
+class CompactSet:
+    """A set of non-negative int keys that fit in 64 bits,
+    stored in an open-addressing hash table of 8-byte slots
+    instead of the Python objects a set holds.
+    It supports the in operator, add and len like a set.
+
+    If max_bytes is given, the table and the Bloom filter together
+    never use more than that many bytes.
+    When the table is full, its keys spill into a Bloom filter
+    of bloom_bytes bytes, which defaults to half of max_bytes,
+    and the table starts over empty.
+    A Bloom filter can claim that a key is in the set when it isn't,
+    so a search using a set that has spilled may skip some States
+    and miss solutions, but it keeps running in bounded memory."""
+
+    def __init__(
+            self,
+            capacity: int = 1 << 12,
+            max_bytes: Optional[int] = None,
+            bloom_bytes: Optional[int] = None,
+            bloom_hashes: int = 4):
+        size = 1
+        while size * MAX_LOAD < capacity:
+            size *= 2
+        if bloom_bytes is None:
+            bloom_bytes = BLOOM_BYTES if max_bytes is None else max_bytes // 2
+        if max_bytes is not None:
+            while size > 1 and 8 * size + bloom_bytes > max_bytes:
+                size //= 2
+            if bloom_bytes < 1 or 8 * size + bloom_bytes > max_bytes:
+                raise ValueError(
+                    f'max_bytes {max_bytes} cannot hold a table'
+                    f' and a Bloom filter of {bloom_bytes} bytes')
+        self.max_bytes = max_bytes
+        self.bloom_bytes = bloom_bytes
+        self.bloom_hashes = bloom_hashes
+        self.bloom: Optional[bytearray] = None
+        self.count = 0  # keys in the table
+        self.spilled = 0  # keys in the Bloom filter
+        self._allocate(size)
+
+    def __contains__(self, key: int) -> bool:
+        slots = self.slots
+        mask = self.mask
+        stored = key + 1
+        index = (key * HASH_MULTIPLIER & HASH_MASK) >> self.shift
+        while True:
+            slot = slots[index]
+            if slot == stored:
+                return True
+            if slot == EMPTY:
+                break
+            index = (index + 1) & mask
+        return self._in_bloom(key)
+
+    def __len__(self) -> int:
+        """Get the number of keys added,
+        which overcounts keys added again after spilling."""
+        return self.count + self.spilled
+
+    def add(self, key: int) -> None:
+        """Add a key to the set."""
+        if not 0 <= key <= MAX_KEY:
+            raise ValueError(f'key {key} does not fit in 64 bits')
+        if self._in_bloom(key):
+            return
+        if self._insert(key + 1):
+            self.count += 1
+            if self.count > len(self.slots) * MAX_LOAD:
+                self._grow()
+
+    def memory_bytes(self) -> int:
+        """Get the number of bytes used by the table and the Bloom filter."""
+        size = self.slots.itemsize * len(self.slots)
+        if self.bloom is not None:
+            size += len(self.bloom)
+        return size
+
+    def memory_report(self) -> Dict[str, int]:
+        """Describe the keys held and the memory used to hold them."""
+        return {
+            'keys': self.count,
+            'spilled_keys': self.spilled,
+            'slots': len(self.slots),
+            'table_bytes': self.slots.itemsize * len(self.slots),
+            'bloom_bytes': 0 if self.bloom is None else len(self.bloom),
+            'total_bytes': self.memory_bytes()
+        }
+
+    def _allocate(self, size: int) -> None:
+        """Replace the table with an empty one of a given number of slots,
+        which must be a power of two."""
+        self.slots = array('Q', bytes(8 * size))
+        self.mask = size - 1
+        self.shift = 64 - (size.bit_length() - 1)
+
+    def _bloom_indexes(self, key: int) -> range:
+        """Get the bit indexes of a key in the Bloom filter."""
+        bits = 8 * self.bloom_bytes
+        first = (key * HASH_MULTIPLIER & HASH_MASK) % bits
+        step = (key * SECOND_MULTIPLIER & HASH_MASK) % bits | 1
+        return range(first, first + step * self.bloom_hashes, step)
+
+    def _grow(self) -> None:
+        """Double the table or, if that would use more than max_bytes,
+        spill its keys into the Bloom filter and empty it."""
+        old_slots = self.slots
+        size = 2 * len(old_slots)
+        if self.max_bytes is not None \
+                and 8 * size + self.bloom_bytes > self.max_bytes:
+            self._spill()
+            return
+
+        self._allocate(size)
+        for stored in old_slots:
+            if stored != EMPTY:
+                self._insert(stored)
+
+    def _in_bloom(self, key: int) -> bool:
+        """Determine if the Bloom filter may hold a key."""
+        bloom = self.bloom
+        if bloom is None:
+            return False
+        bits = 8 * self.bloom_bytes
+        for index in self._bloom_indexes(key):
+            index %= bits
+            if not bloom[index >> 3] & 1 << (index & 7):
+                return False
+        return True
+
+    def _insert(self, stored: int) -> bool:
+        """Put a stored key in the table.
+        Returns False if it was already there."""
+        slots = self.slots
+        mask = self.mask
+        index = ((stored - 1) * HASH_MULTIPLIER & HASH_MASK) >> self.shift
+        while True:
+            slot = slots[index]
+            if slot == stored:
+                return False
+            if slot == EMPTY:
+                slots[index] = stored
+                return True
+            index = (index + 1) & mask
+
+    def _spill(self) -> None:
+        """Move every key in the table into the Bloom filter."""
+        if self.bloom is None:
+            self.bloom = bytearray(self.bloom_bytes)
+        bloom = self.bloom
+        bits = 8 * self.bloom_bytes
+        for stored in self.slots:
+            if stored != EMPTY:
+                for index in self._bloom_indexes(stored - 1):
+                    index %= bits
+                    bloom[index >> 3] |= 1 << (index & 7)
+        self.spilled += self.count
+        self.count = 0
+        self._allocate(len(self.slots))
@@ -0,0 +1,185 @@
+"""Writes and reads puzzle corpus files, which hold puzzles
+as fixed-size binary records instead of CSV rows.
+Enter `python corpus.py lunar_lockout puzzles.csv puzzles.pzc`
+to convert a puzzle file of a game to a corpus file,
+reading standard input if the puzzle file is `-`."""
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+import lunar_lockout
+import moving_pieces
+import tilt
+from lunar_lockout import LunarLockout
+from moving_pieces import MovingPieces
+from share import CORPUS_SUFFIX
+from tilt import Tilt
+
+# A file starts with a header holding MAGIC, the name of its game,
+# FORMAT_VERSION, the RULES_VERSION of the game,
+# the number of columns and rows of the board,
+# the size of each record and the number of records.
+# Each record holds a puzzle number as 4 bytes followed by its State.
+MAGIC = b'PZCO'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4s16sIIIIII4x')
+NUMBER = struct.Struct('<I')
+
+# The number of bytes in a State and functions that convert
+# a State to those bytes and back.
+Codec = Tuple[int, Callable[[Any], bytes], Callable[[memoryview], Any]]
+
+
+def _codec(game: Any) -> Codec:
+    """Get the Codec of a game for its current board size.
+    Lunar Lockout and Tilt States are ints stored in as few bytes
+    as hold them; Moving Pieces States are stored as the cell number
+    of each piece in one byte each."""
+    if issubclass(game, LunarLockout):
+        bits = len(lunar_lockout.robot_ids) * lunar_lockout.CELL_BITS
+        return _int_codec((bits + 7) // 8)
+    if issubclass(game, Tilt):
+        bits = tilt.SIZE * tilt.SIZE * tilt.CELL_BITS
+        return _int_codec((bits + 7) // 8)
+    if issubclass(game, MovingPieces):
+        columns, rows = game.board_size()
+        if columns * rows > 256:
+            raise ValueError('Moving Pieces corpus files only support'
+                             ' boards of up to 256 cells')
+        piece_ids = moving_pieces.piece_ids
+
+        def encode(state: Any) -> bytes:
+            positions = moving_pieces.unpack_positions(state)
+            return bytes((row - 1) * columns + column - 1
+                         for column, row in (positions[piece_id]
+                                             for piece_id in piece_ids))
+
+        def decode(data: memoryview) -> Any:
+            positions = {}
+            for piece_id, cell in zip(piece_ids, data):
+                row, column = divmod(cell, columns)
+                positions[piece_id] = (column + 1, row + 1)
+            return moving_pieces.pack_positions(positions)
+
+        return len(piece_ids), encode, decode
+    raise ValueError(game.__name__ + ' has no corpus format')
+
+
+def _int_codec(size: int) -> Codec:
+    """Get the Codec of States that are ints of size bytes."""
+    return (size,
+            lambda state: state.to_bytes(size, 'little'),
+            lambda data: int.from_bytes(data, 'little'))
+
+
+def write_corpus(
+        path: str, game: Any, puzzles: Iterable[Tuple[int, Any]]) -> int:
+    """Write the numbers and States of puzzles of a game
+    to a corpus file one at a time and return how many there were."""
+    state_size, encode, _ = _codec(game)
+    record_size = NUMBER.size + state_size
+    name = game.__name__.encode()
+    columns, rows = game.board_size()
+    count = 0
+    with open(path, 'wb') as file:
+        # The header is written again once the number of records is known.
+        file.write(bytes(HEADER.size))
+        for number, state in puzzles:
+            file.write(NUMBER.pack(number) + encode(state))
+            count += 1
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, name, FORMAT_VERSION,
+                               game.RULES_VERSION, columns, rows,
+                               record_size, count))
+    return count
+
+
+def convert(game: Any, csv_path: str, corpus_path: str) -> int:
+    """Convert a puzzle file of a game to a corpus file
+    and return the number of puzzles in it."""
+    return write_corpus(corpus_path, game, game.iter_puzzles(csv_path))
+
+
+class Corpus:
+    """A memory-mapped corpus file written by write_corpus.
+    Records are read by slicing the mapping, so processes that open
+    the same file share its pages instead of each parsing the puzzles.
+    Indexing a Corpus gets the number and State of a puzzle
+    by its position in the file."""
+
+    def __init__(self, path: str, game: Any):
+        with open(path, 'rb') as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, name, version, rules_version, columns, rows, \
+            self.record_size, self.count = HEADER.unpack_from(self.mapping)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(path + ' is not a corpus file')
+        if name.rstrip(b'\0').decode() != game.__name__ \
+                or rules_version != game.RULES_VERSION \
+                or (columns, rows) != game.board_size():
+            raise ValueError(path + ' was written for other game rules')
+
+        state_size, _, self._decode = _codec(game)
+        if self.record_size != NUMBER.size + state_size:
+            raise ValueError(path + ' does not have records of this game')
+        start = HEADER.size
+        self.records = memoryview(self.mapping)[
+            start:start + self.record_size * self.count]
+
+    def __getitem__(self, index: int) -> Tuple[int, Any]:
+        if not 0 <= index < self.count:
+            raise IndexError('corpus index out of range')
+        start = index * self.record_size
+        record = self.records[start:start + self.record_size]
+        return NUMBER.unpack_from(record)[0], \
+            self._decode(record[NUMBER.size:])
+
+    def __iter__(self) -> Iterator[Tuple[int, Any]]:
+        for index in range(self.count):
+            yield self[index]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self.records.release()
+        self.mapping.close()
+
+    def number(self, index: int) -> int:
+        """Get the number of a puzzle without decoding its State."""
+        return NUMBER.unpack_from(self.records, index * self.record_size)[0]
+
+
+# Corpus files opened by open_corpus, by path.
+_open_corpora: Dict[str, Corpus] = {}
+
+
+def open_corpus(path: str, game: Any) -> Corpus:
+    """Get the Corpus in a file, mapping it the first time it is needed
+    so each process maps a file only once."""
+    corpus = _open_corpora.get(path)
+    if corpus is None:
+        corpus = _open_corpora[path] = Corpus(path, game)
+    return corpus
+
+
+def main() -> None:
+    games = {'lunar_lockout': LunarLockout, 'moving_pieces': MovingPieces,
+             'tilt': Tilt}
+    if len(sys.argv) != 4 or sys.argv[1] not in games:
+        print('usage: python corpus.py lunar_lockout|moving_pieces|tilt'
+              ' puzzle-file corpus-file')
+        sys.exit(1)
+
+    _, name, csv_path, corpus_path = sys.argv
+    if not corpus_path.endswith(CORPUS_SUFFIX):
+        print(f'The name of a corpus file must end with {CORPUS_SUFFIX}.')
+        sys.exit(1)
+    count = convert(games[name], csv_path, corpus_path)
+    print(f'{corpus_path}: {count:,} puzzles,'
+          f' {os.path.getsize(corpus_path):,} bytes')
+
+
+if __name__ == '__main__':
+    main()
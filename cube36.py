@@ -4,13 +4,35 @@
 # the O6 piece must go on a tower that seems to need a 5 piece.
 # Many hours of my life were wasted until I found this website:
 # https://daniel.hepper.net/blog/2010/01/how-to-solve-the-36-cube-puzzle/
+from concurrent.futures import ProcessPoolExecutor
+import functools
 from itertools import permutations
-import sys
-from typing import List, Set, Tuple
+import os
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 
+# Each permutation holds the color number, from one, in each column of a row.
 Permutation = Tuple[int, ...]
 Permutations = List[Permutation]
 
+# Each string holds the height digits of a row of the board.
+Heights = List[str]
+
+# The pieces of a solved board by row and column, such as 'P5'.
+Board = List[List[str]]
+
+# An engine finds every solution for given board heights,
+# optionally only those with a given second row.
+Engine = Callable[[Heights, Optional[Permutation]], Iterator[Permutations]]
+
+# An exact cover option places a color at a board position.
+# It holds the row, the column and the color number.
+Placement = Tuple[int, int, int]
+
+# An exact cover item is a constraint that exactly one option must meet,
+# such as a board position being filled or a piece being used.
+Item = Tuple[str, int, int]
+
 # These numbers represent the size of the piece
 # that will fit at each board position.
 BOARD_HEIGHTS = [
@@ -29,32 +51,278 @@ SIZE = len(BOARD_HEIGHTS)
 
 
 def log(perms: Permutations, text: str) -> None:
-    if len(perms) == 6:
+    # Only complete boards, which have as many rows as columns, are logged.
+    if perms and len(perms) == len(perms[0]):
         print(text)
 
 
-def print_board(perms: Permutations) -> None:
-    if len(perms) < 6:
+def _algorithm_x(
+        items: Dict[Item, Set[Placement]],
+        options: Dict[Placement, List[Item]],
+        chosen: List[Placement]) -> Iterator[List[Placement]]:
+    """Find every set of options that covers each remaining item
+    exactly once using Knuth's Algorithm X, yielding the chosen options.
+    items maps each uncovered item to the options that cover it.
+    Both are restored before this returns."""
+    if not items:
+        yield list(chosen)
+        return
+
+    # Branch on the item covered by the fewest options.
+    item = min(items, key=lambda i: len(items[i]))
+    for option in list(items[item]):
+        chosen.append(option)
+        removed = _select(items, options, option)
+        yield from _algorithm_x(items, options, chosen)
+        _deselect(items, options, option, removed)
+        chosen.pop()
+
+
+def _check_board(board_heights: Heights, colors: List[str]) -> None:
+    """Raise a ValueError if board heights are not a square of digits
+    from one to their size or there is not a color for each row."""
+    size = len(board_heights)
+    digits = {str(height) for height in range(1, size + 1)}
+    if not 0 < size < 10 \
+            or any(len(row) != size or not set(row) <= digits
+                   for row in board_heights):
+        raise ValueError('board heights must be a square of digits'
+                         ' from 1 to the number of rows')
+    if len(colors) != size:
+        raise ValueError(f'{size} colors are needed')
+
+
+def _column_mask(perm: Permutation) -> int:
+    """Get a mask with a bit set for the color in each column
+    of a row with a given permutation."""
+    size = len(perm)
+    return sum(1 << (column * size + color - 1)
+               for column, color in enumerate(perm))
+
+
+def _deselect(
+        items: Dict[Item, Set[Placement]],
+        options: Dict[Placement, List[Item]],
+        option: Placement,
+        removed: List[Set[Placement]]) -> None:
+    """Undo _select."""
+    for item in reversed(options[option]):
+        items[item] = removed.pop()
+        for other in items[item]:
+            for other_item in options[other]:
+                if other_item != item:
+                    items[other_item].add(other)
+
+
+def _piece_mask(board_row: str, perm: Permutation) -> int:
+    """Get a mask with a bit set for each piece used
+    by a row of the board with a given permutation."""
+    size = len(perm)
+    return sum(1 << ((color - 1) * size + int(board_row[column]) - 1)
+               for column, color in enumerate(perm))
+
+
+@functools.lru_cache(maxsize=None)
+def _row_permutations(size: int) -> Tuple[Permutation, Permutations]:
+    """Get the permutation used for the first row of a board of a given size
+    and the permutations that may be used for the other rows."""
+    # There are SIZE factorial of these.
+    # We can only iterate over an iterator once.
+    # Realizing this as a list enables iterating over multiple times.
+    size_permutations: Permutations = list(permutations(range(1, size + 1)))
+
+    # There is no reason to evaluate any permutation
+    # other than the first for p1.
+    p1 = size_permutations.pop(0)
+
+    return p1, list(filter(keep_perm, size_permutations))
+
+
+def _select(
+        items: Dict[Item, Set[Placement]],
+        options: Dict[Placement, List[Item]],
+        option: Placement) -> List[Set[Placement]]:
+    """Cover the items of an option, removing the options that
+    conflict with it. Returns the removed sets of options for _deselect."""
+    removed = []
+    for item in options[option]:
+        for other in items[item]:
+            for other_item in options[other]:
+                if other_item != item:
+                    items[other_item].remove(other)
+        removed.append(items.pop(item))
+    return removed
+
+
+def _solve_branch(
+        engine: str,
+        board_heights: Heights,
+        p2: Permutation) -> List[Permutations]:
+    """Find every solution with a given second row in a worker process."""
+    return list(ENGINES[engine](board_heights, p2))
+
+
+def board_pieces(
+        perms: Permutations,
+        board_heights: Heights = BOARD_HEIGHTS,
+        colors: List[str] = COLORS) -> Board:
+    """Get the piece at each position of a board
+    holding a given permutation of colors in each row."""
+    return [[colors[color - 1] + board_row[column]
+             for column, color in enumerate(perm)]
+            for perm, board_row in zip(perms, board_heights)]
+
+
+def brute_force_solutions(
+        board_heights: Heights = BOARD_HEIGHTS,
+        p2: Optional[Permutation] = None) -> Iterator[Permutations]:
+    """Find every solution by trying permutations of colors
+    for each row in nested loops, checking the rows so far at each level.
+    The first row is fixed because the colors can be renamed."""
+    p1, size_permutations = _row_permutations(len(board_heights))
+    perms = [p1]
+
+    def extend() -> Iterator[Permutations]:
+        if len(perms) == len(board_heights):
+            yield list(perms)
+            return
+        candidates = [p2] if p2 and len(perms) == 1 else size_permutations
+        for perm in candidates:
+            perms.append(perm)
+            if solution(perms, board_heights):
+                yield from extend()
+            perms.pop()
+
+    yield from extend()
+
+
+def exact_cover_solutions(
+        board_heights: Heights = BOARD_HEIGHTS,
+        p2: Optional[Permutation] = None) -> Iterator[Permutations]:
+    """Find every solution by solving it as an exact cover problem.
+    Each option places a color at a board position and covers
+    that position, the color in its row, the color in its column
+    and the piece of that color and height.
+    The first row is fixed to p1 because the colors can be renamed."""
+    size = len(board_heights)
+    p1, _ = _row_permutations(size)
+    options: Dict[Placement, List[Item]] = {}
+    for row in range(size):
+        for column in range(size):
+            height = int(board_heights[row][column])
+            for color in range(1, size + 1):
+                options[(row, column, color)] = [
+                    ('cell', row, column),
+                    ('row', row, color),
+                    ('column', column, color),
+                    ('piece', color, height)]
+
+    items: Dict[Item, Set[Placement]] = {}
+    for option, option_items in options.items():
+        for item in option_items:
+            items.setdefault(item, set()).add(option)
+
+    chosen = [(0, column, color) for column, color in enumerate(p1)]
+    if p2:
+        chosen += [(1, column, color) for column, color in enumerate(p2)]
+    for option in chosen:
+        if any(item not in items for item in options[option]):
+            return  # p2 conflicts with p1
+        _select(items, options, option)
+
+    for placements in _algorithm_x(items, options, chosen):
+        rows = [[0] * size for _ in range(size)]
+        for row, column, color in placements:
+            rows[row][column] = color
+        yield [tuple(row) for row in rows]
+
+
+def incremental_solutions(
+        board_heights: Heights = BOARD_HEIGHTS,
+        p2: Optional[Permutation] = None) -> Iterator[Permutations]:
+    """Find every solution by trying permutations of colors
+    for each row, like brute_force_solutions, but keeping masks of
+    the colors used in each column and the pieces used
+    as rows are added and removed, so a permutation is checked
+    with a bitwise AND instead of checking every row again.
+    Only permutations whose colors differ in every column from
+    every row so far are tried, found by ANDing their entries in
+    an index of the permutations compatible with each one."""
+    size = len(board_heights)
+    p1, size_permutations = _row_permutations(size)
+    column_masks = [_column_mask(perm) for perm in size_permutations]
+    compatible = [
+        sum(1 << i for i, other in enumerate(column_masks)
+            if not other & mask)
+        for mask in column_masks]
+    piece_masks = [[_piece_mask(board_row, perm)
+                    for perm in size_permutations]
+                   for board_row in board_heights]
+    perms = [p1]
+
+    def extend(candidates: int, pieces: int) -> Iterator[Permutations]:
+        row = len(perms)
+        if row == size:
+            yield list(perms)
+            return
+
+        row_masks = piece_masks[row]
+        remaining = candidates
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            index = bit.bit_length() - 1
+            mask = row_masks[index]
+            if pieces & mask:
+                continue
+            perms.append(size_permutations[index])
+            yield from extend(candidates & compatible[index], pieces | mask)
+            perms.pop()
+
+    # Every filtered permutation is compatible with p1.
+    candidates = (1 << len(size_permutations)) - 1
+    pieces = _piece_mask(board_heights[0], p1)
+    if p2:
+        if p2 not in size_permutations:
+            return  # p2 conflicts with p1
+        index = size_permutations.index(p2)
+        mask = piece_masks[1][index]
+        if pieces & mask:
+            return
+        perms.append(p2)
+        candidates &= compatible[index]
+        pieces |= mask
+    yield from extend(candidates, pieces)
+
+
+def keep_perm(perm: Permutation) -> bool:
+    return all(map(lambda t: t[1] != t[0] + 1, enumerate(perm)))
+
+
+def print_board(board: Board) -> None:
+    if not board or len(board) < len(board[0]):
         return
     print()
-    for row, perm in enumerate(perms):
-        board_row = BOARD_HEIGHTS[row]
-        s = ''
-        for column in range(SIZE):
-            index = perm[column]
-            color = COLORS[index - 1]
-            height = board_row[column]
-            s += color + height + ' '
-        print(s)
+    for row in board:
+        print(' '.join(row) + ' ')
+
 
+def second_rows(board_heights: Heights = BOARD_HEIGHTS) -> Permutations:
+    """Get the permutations that may be used for the second row of a board,
+    which split the search for solutions into independent branches."""
+    p1, size_permutations = _row_permutations(len(board_heights))
+    return [p2 for p2 in size_permutations
+            if solution([p1, p2], board_heights)]
 
-def solution(perms: Permutations) -> bool:
+
+def solution(
+        perms: Permutations, board_heights: Heights = BOARD_HEIGHTS) -> bool:
     # log(perms, '\nEvaluating:')
-    # print_board(perms)
+    # print_board(board_pieces(perms))
 
     # Check for duplicate colors in any column.
     color_numbers: Set[int] = set()
-    for column in range(SIZE):
+    for column in range(len(board_heights)):
         for perm in perms:
             color_number = perm[column]
             if color_number in color_numbers:
@@ -63,13 +331,12 @@ def solution(perms: Permutations) -> bool:
         color_numbers.clear()
 
     # Verify that all the pieces are unique.
-    pieces: Set[str] = set()
+    pieces: Set[Tuple[int, str]] = set()
     for row, perm in enumerate(perms):
-        board_row = BOARD_HEIGHTS[row]
-        for column in range(SIZE):
-            color = COLORS[perm[column] - 1]
+        board_row = board_heights[row]
+        for column in range(len(board_heights)):
             height = board_row[column]
-            piece = color + height
+            piece = (perm[column], height)
             if piece in pieces:
                 # log(perms, f'duplicated piece {piece}')
                 return False
@@ -77,39 +344,69 @@ def solution(perms: Permutations) -> bool:
     return True
 
 
-def keep_perm(perm: Permutation) -> bool:
-    return all(map(lambda t: t[1] != t[0] + 1, enumerate(perm)))
+def solutions(
+        board_heights: Heights = BOARD_HEIGHTS,
+        colors: List[str] = COLORS,
+        engine: str = 'incremental',
+        workers: int = 1) -> Iterator[Board]:
+    """Generate every solution for a board with given heights,
+    naming the colors of the pieces with a given list,
+    using an engine named by a key of ENGINES.
+    The first row of every solution uses the colors in order
+    because any solution can be turned into one that does
+    by renaming colors.
+    If workers is more than one, the branches for each second row
+    are searched in that many worker processes."""
+    _check_board(board_heights, colors)
+    if workers > 1:
+        branches = second_rows(board_heights)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for branch in executor.map(
+                    _solve_branch,
+                    [engine] * len(branches),
+                    [board_heights] * len(branches),
+                    branches):
+                for perms in branch:
+                    yield board_pieces(perms, board_heights, colors)
+    else:
+        for perms in ENGINES[engine](board_heights, None):
+            yield board_pieces(perms, board_heights, colors)
 
 
-# There are 720 of these which is SIZE factorial.
-# We can only iterate over an iterator once.
-# Realizing this as a list enables iterating over multiple times.
-size_permutations: Permutations = list(permutations(range(1, SIZE + 1)))
+ENGINES: Dict[str, Engine] = {
+    'brute_force': brute_force_solutions,
+    'exact_cover': exact_cover_solutions,
+    'incremental': incremental_solutions
+}
 
-# There is no reason to evaluate any permutation
-# other than the first for p1.
-p1 = size_permutations.pop(0)
 
-size_permutations = list(filter(keep_perm, size_permutations))
-print('filtered permutations =', len(size_permutations))
+def main() -> None:
+    _, size_permutations = _row_permutations(SIZE)
+    print('filtered permutations =', len(size_permutations))
+    print('second rows =', len(second_rows()))
+    for name in ENGINES:
+        start = time.perf_counter()
+        first: Optional[Board] = next(solutions(engine=name), None)
+        first_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        count = sum(1 for _ in solutions(engine=name))
+        all_seconds = time.perf_counter() - start
+        print(f'\n{name}: first solution in {first_seconds:.3f} seconds, '
+              f'all {count} in {all_seconds:.3f} seconds')
+        if first is None:
+            print('\nno solution found'.upper())
+        else:
+            print('\nSolution:')
+            print_board(first)
 
-for p2 in size_permutations:
-    if not solution([p1, p2]):
-        continue
-    for p3 in size_permutations:
-        if not solution([p1, p2, p3]):
-            continue
-        for p4 in size_permutations:
-            if not solution([p1, p2, p3, p4]):
-                continue
-            for p5 in size_permutations:
-                if not solution([p1, p2, p3, p4, p5]):
-                    continue
-                for p6 in size_permutations:
-                    ps = [p1, p2, p3, p4, p5, p6]
-                    if solution(ps):
-                        print('\nSolution:')
-                        print_board(ps)
-                        sys.exit()
-
-print('\nno solution found'.upper())
+    workers = os.cpu_count() or 1
+    for name in ENGINES:
+        start = time.perf_counter()
+        count = sum(1 for _ in solutions(engine=name, workers=workers))
+        seconds = time.perf_counter() - start
+        print(f'{name} with {workers} workers: all {count}'
+              f' in {seconds:.3f} seconds')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""Generates puzzles whose shortest solutions take a given number of moves
+and writes them in the format of the puzzle files.
+Enter `python generate.py lunar_lockout --moves 10 --count 20`
+to print 20 new Lunar Lockout puzzles that take 10 moves,
+or `python generate.py --help` for the other options."""
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Iterator, List, Optional, Set
+import lunar_lockout
+import tilt
+from lunar_lockout import LunarLockout
+from moving_pieces import MovingPieces
+from parallel import worker_pool
+from solver import GAMES, GameClass, load_game, parse_numbers
+from solver import solve_with_budget
+from tilt import Tilt
+
+# Number of helper robots in sampled Lunar Lockout puzzles.
+HELPERS = 4
+
+# Pieces in sampled Tilt puzzles: X for blockers, G for green pieces
+# and B for blue pieces.
+TILT_PIECES = 'XXGGB'
+
+# Random moves taken from a solved State to sample a Moving Pieces puzzle.
+WALK_LENGTH = 5000
+
+# Puzzles each worker process samples before returning those it kept.
+SAMPLE_BATCH = 100
+
+# Most nodes expanded checking the solution length of a sampled puzzle
+# and most puzzles sampled before giving up on finding more.
+MAX_NODES = 200_000
+MAX_SAMPLES = 1_000_000
+
+# Ways of generating puzzles.
+# backward searches from the solved States, so every puzzle of
+# the requested lengths is found without solving any of them.
+# It needs a game whose moves can be undone or a tablebase builder.
+# sample makes random puzzles and keeps those the bfs engine
+# solves in the requested number of moves.
+METHODS = ['backward', 'sample']
+
+
+def backward_puzzles(
+        game: GameClass,
+        moves: Set[int],
+        rng: random.Random,
+        helpers: int = HELPERS) -> Iterator[Any]:
+    """Yield, in random order, every State of a game whose
+    shortest solution takes one of the numbers of moves,
+    found by searching backward from the solved States."""
+    if issubclass(game, LunarLockout):
+        import tablebase  # pylint: disable=C0415
+        distances = tablebase.build_lunar_lockout(helpers)
+        entries = [entry for entry, distance in enumerate(distances)
+                   if distance in moves]
+        rng.shuffle(entries)
+        for entry in entries:
+            yield tablebase.ll_entry_state(entry, helpers)
+    elif issubclass(game, MovingPieces):
+        # Every move can be undone, so the States first reached
+        # searching forward from the solved States are the same
+        # as those found searching backward.
+        states = []
+        frontier = game.get_solved_states()
+        seen = {game.state_key(state) for state in frontier}
+        for distance in range(1, max(moves) + 1):
+            next_frontier = []
+            for state in frontier:
+                for action in game.get_possible_actions(state):
+                    new_state = game.take_action(
+                        state, action, validate=False)
+                    key = game.state_key(new_state)
+                    if key not in seen:
+                        seen.add(key)
+                        next_frontier.append(new_state)
+            if distance in moves:
+                states.extend(next_frontier)
+            frontier = next_frontier
+        rng.shuffle(states)
+        yield from states
+    else:
+        raise ValueError(game.__name__ + ' moves cannot be searched backward')
+
+
+def generate(
+        game: GameClass,
+        moves: Set[int],
+        count: int,
+        method: Optional[str] = None,
+        workers: Optional[int] = None,
+        seed: Optional[int] = None,
+        helpers: int = HELPERS,
+        pieces: str = TILT_PIECES,
+        max_nodes: int = MAX_NODES) -> Iterator[Any]:
+    """Yield up to count States of a game whose shortest solutions
+    take one of the numbers of moves, no two with the same state_key.
+    method is a name in METHODS and defaults to backward
+    for the games that support it.
+    Sampling runs in workers processes, which defaults to
+    the number of CPUs."""
+    if method is None:
+        method = 'backward' if _can_search_backward(game) else 'sample'
+    rng = random.Random(seed)
+    if method == 'backward':
+        states = backward_puzzles(game, moves, rng, helpers)
+    else:
+        states = sampled_puzzles(
+            game, moves, rng, workers, helpers, pieces, max_nodes)
+
+    keys: Set[Any] = set()
+    for state in states:
+        if len(keys) == count:
+            break
+        key = game.state_key(state)
+        if key not in keys:
+            keys.add(key)
+            yield state
+
+
+def sample(
+        game: GameClass,
+        rng: random.Random,
+        helpers: int = HELPERS,
+        pieces: str = TILT_PIECES) -> Any:
+    """Make a random State of a game that is not solved.
+    It may not have a solution."""
+    if issubclass(game, LunarLockout):
+        cells = lunar_lockout.SIZE * lunar_lockout.SIZE
+        red, *others = rng.sample(range(cells), helpers + 1)
+        while red == lunar_lockout.CENTER_CELL:
+            red, *others = rng.sample(range(cells), helpers + 1)
+        # Helpers are interchangeable, so they are kept in order of cell
+        # to give each puzzle a single State.
+        others.sort()
+        others += [lunar_lockout.ABSENT] * (
+            len(lunar_lockout.robot_ids) - 1 - helpers)
+        return sum(cell << (index * lunar_lockout.CELL_BITS)
+                   for index, cell in enumerate([red] + others))
+    if issubclass(game, Tilt):
+        size = tilt.SIZE
+        board = [[' '] * size for _ in range(size)]
+        board[tilt.CENTER][tilt.CENTER] = tilt.TARGET
+        free_cells = [cell for cell in range(size * size)
+                      if cell != tilt.CENTER * size + tilt.CENTER]
+        for piece, cell in zip(pieces, rng.sample(free_cells, len(pieces))):
+            board[cell // size][cell % size] = piece
+        return tilt.pack_board(board)
+
+    state = rng.choice(game.get_solved_states())
+    for _ in range(WALK_LENGTH):
+        action = rng.choice(game.get_possible_actions(state))
+        state = game.take_action(state, action, validate=False)
+    return state
+
+
+def sampled_puzzles(
+        game: GameClass,
+        moves: Set[int],
+        rng: random.Random,
+        workers: Optional[int] = None,
+        helpers: int = HELPERS,
+        pieces: str = TILT_PIECES,
+        max_nodes: int = MAX_NODES) -> Iterator[Any]:
+    """Yield random States of a game whose shortest solutions
+    take one of the numbers of moves, sampled and solved in batches
+    by a pool of worker processes, until MAX_SAMPLES have been tried.
+    The same State may be yielded more than once."""
+    workers = workers or os.cpu_count() or 1
+    batches = MAX_SAMPLES // SAMPLE_BATCH
+    pending: Deque[Future] = deque()
+    with worker_pool(game, workers) as executor:
+        try:
+            for _ in range(batches):
+                pending.append(executor.submit(
+                    _sample_batch, game, moves, rng.getrandbits(64),
+                    helpers, pieces, max_nodes))
+                # Keep every worker busy while the oldest batch is waited for.
+                if len(pending) > 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # Once enough puzzles are found, drop the batches not started.
+            for future in pending:
+                future.cancel()
+
+
+def _can_search_backward(game: GameClass) -> bool:
+    """Determine if backward_puzzles supports a game
+    with its current board size."""
+    if issubclass(game, LunarLockout):
+        # Lunar Lockout tablebases are only built for the board size
+        # the tablebase module was loaded with, which is the default.
+        return game.board_size() == (5, 5)
+    return issubclass(game, MovingPieces)
+
+
+def _sample_batch(
+        game: GameClass,
+        moves: Set[int],
+        seed: int,
+        helpers: int,
+        pieces: str,
+        max_nodes: int) -> List[Any]:
+    """Sample SAMPLE_BATCH States of a game in a worker process
+    and get those whose shortest solutions take one of the numbers
+    of moves."""
+    rng = random.Random(seed)
+    states = []
+    for _ in range(SAMPLE_BATCH):
+        state = sample(game, rng, helpers, pieces)
+        solution, _ = solve_with_budget(state, game, 'bfs', max_nodes)
+        if solution is not None and len(solution) in moves:
+            states.append(state)
+    return states
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Generate puzzles whose shortest solutions'
+                    ' take a given number of moves.')
+    parser.add_argument('game', choices=sorted(GAMES))
+    parser.add_argument(
+        '--moves', required=True, metavar='LIST',
+        help="numbers of moves and ranges, such as '10' or '8-10'")
+    parser.add_argument(
+        '--count', type=int, default=10,
+        help='number of puzzles to generate (default 10)')
+    parser.add_argument(
+        '--method', choices=METHODS,
+        help='backward (the default for Lunar Lockout and Moving Pieces)'
+             ' or sample (the default for Tilt)')
+    parser.add_argument(
+        '--workers', type=int,
+        help='processes sampling puzzles (default the number of CPUs)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument(
+        '--helpers', type=int, default=HELPERS,
+        help=f'Lunar Lockout helper robots (default {HELPERS})')
+    parser.add_argument(
+        '--pieces', default=TILT_PIECES,
+        help=f'sampled Tilt pieces (default {TILT_PIECES})')
+    parser.add_argument(
+        '--max-nodes', type=int, default=MAX_NODES,
+        help='skip sampled puzzles that take more nodes to solve'
+             f' (default {MAX_NODES})')
+    parser.add_argument(
+        '--first', type=int, default=1,
+        help='number of the first puzzle (default 1)')
+    parser.add_argument(
+        '--output', default='-',
+        help="puzzle file to write, or '-' for standard output (the default)")
+    args = parser.parse_args(argv)
+    try:
+        args.moves = set(parse_numbers(args.moves))
+    except ValueError as error:
+        parser.error(f'--moves: {error}')
+    most_helpers = len(lunar_lockout.robot_ids) - 1
+    if not 0 <= args.helpers <= most_helpers:
+        parser.error(f'--helpers must be from 0 to {most_helpers}')
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    game = load_game(args.game)
+    moves = args.moves
+    if min(moves) < 1:
+        sys.exit('Puzzles must take at least one move.')
+
+    start = time.perf_counter()
+    count = 0
+    with (open(sys.stdout.fileno(), 'w', closefd=False, newline='')
+          if args.output == '-' else open(args.output, 'w', newline='')) \
+            as file:
+        writer = csv.writer(file)
+        for state in generate(
+                game, moves, args.count, args.method, args.workers,
+                args.seed, args.helpers, args.pieces, args.max_nodes):
+            writer.writerow([args.first + count] + game.puzzle_row(state))
+            file.flush()
+            count += 1
+    elapsed = time.perf_counter() - start
+    print(f'Generated {count} puzzles in {elapsed:.1f} seconds.',
+          file=sys.stderr)
+    if count < args.count:
+        sys.exit(f'Only {count} puzzles of that length were found.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import cProfile
+import sys
+import time
+from collections import Counter, defaultdict
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+# Methods of a game that Instrumentation counts and times.
+GAME_METHODS = [
+    'get_possible_actions', 'is_solved', 'state_key', 'state_string',
+    'take_action']
+
+# Functions of the solver module that Instrumentation counts and times.
+SOLVER_FUNCTIONS = ['visited']
+
+
+class Instrumentation:
+    """Counts and times the calls a search engine makes
+    to the methods of a game and to the solver functions it uses,
+    and records the number of nodes expanded at each depth
+    and how many Actions each of them had.
+
+    Nothing is changed until the Instrumentation is entered
+    as a context manager, so searches run at full speed without it.
+    While it is entered, search with the game in its game attribute
+    and call run to time and optionally profile a search:
+
+        with Instrumentation(Game, solver) as instrumentation:
+            instrumentation.run(solver.solve, state)
+        instrumentation.report()
+
+    If profile_path is given, run also profiles the searches
+    with cProfile and the statistics are written to that path on exit,
+    to be read with the pstats module."""
+
+    def __init__(
+            self,
+            game: Any,
+            module: Optional[ModuleType] = None,
+            profile_path: Optional[str] = None):
+        self.calls: Counter = Counter()
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.nodes_per_depth: Counter = Counter()
+        # Counts of the number of Actions of the nodes at each depth.
+        self.branching: Dict[int, Counter] = {}
+        self.profile_path = profile_path
+        self.profile = cProfile.Profile() if profile_path else None
+        self.module = module
+        self._originals: Dict[str, Callable] = {}
+        self._depths: Dict[Any, int] = {}
+        self.game = self._instrument_game(game)
+
+    def __enter__(self) -> 'Instrumentation':
+        if self.module is not None:
+            for name in SOLVER_FUNCTIONS:
+                function = getattr(self.module, name)
+                self._originals[name] = function
+                setattr(self.module, name, self._timed(name, function))
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        for name, function in self._originals.items():
+            setattr(self.module, name, function)
+        self._originals.clear()
+        if self.profile is not None and self.profile_path:
+            self.profile.dump_stats(self.profile_path)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Describe what was recorded in a form that can be saved as JSON."""
+        return {
+            'calls': dict(self.calls),
+            'seconds': dict(self.seconds),
+            'nodes_per_depth': {
+                str(depth): count
+                for depth, count in sorted(self.nodes_per_depth.items())},
+            'branching': {
+                str(depth): {str(actions): count
+                             for actions, count in sorted(counts.items())}
+                for depth, counts in sorted(self.branching.items())}
+        }
+
+    def report(self) -> None:
+        """Print the calls and time of each function and method,
+        then the nodes expanded at each depth with a histogram
+        of the number of Actions they had."""
+        print(f'{"function":>22} {"calls":>10} {"seconds":>9} {"us/call":>8}')
+        for name, calls in self.calls.most_common():
+            seconds = self.seconds[name]
+            print(f'{name:>22} {calls:>10,} {seconds:>9.3f}'
+                  f' {seconds / calls * 1e6:>8.2f}')
+
+        print(f'\n{"depth":>5} {"nodes":>8} {"mean":>6}  actions: nodes')
+        for depth in sorted(self.nodes_per_depth):
+            nodes = self.nodes_per_depth[depth]
+            counts = self.branching[depth]
+            mean = sum(a * n for a, n in counts.items()) / nodes
+            histogram = ' '.join(f'{actions}:{count}'
+                                 for actions, count in sorted(counts.items()))
+            print(f'{depth:>5} {nodes:>8,} {mean:>6.2f}  {histogram}')
+
+    def run(self, engine: Callable, state: Any) -> Any:
+        """Search from a State with an engine using the instrumented game
+        and return its Result."""
+        name = engine.__name__
+        self._depths.clear()
+        self.calls[name] += 1
+        start = time.perf_counter()
+        if self.profile is not None:
+            self.profile.enable()
+        try:
+            return engine(state, self.game)
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            self.seconds[name] += time.perf_counter() - start
+
+    def _instrument_game(self, game: Any) -> Any:
+        """Make a subclass of a game whose methods are counted and timed
+        and whose get_possible_actions and take_action also track
+        the depth of each State."""
+        methods = {name: staticmethod(self._timed(name, getattr(game, name)))
+                   for name in GAME_METHODS}
+        get_possible_actions = methods['get_possible_actions'].__func__
+        take_action = methods['take_action'].__func__
+        state_key = game.state_key
+        depths = self._depths
+
+        def expand(state: Any) -> List[Any]:
+            actions = get_possible_actions(state)
+            # States not reached by take_action start a new search.
+            depth = depths.setdefault(state_key(state), 0)
+            self.nodes_per_depth[depth] += 1
+            self.branching.setdefault(depth, Counter())[len(actions)] += 1
+            return actions
+
+        def act(state: Any, action: Any, validate: bool = True) -> Any:
+            new_state = take_action(state, action, validate)
+            depth = depths.get(state_key(state), 0) + 1
+            key = state_key(new_state)
+            if depths.get(key, sys.maxsize) > depth:
+                depths[key] = depth
+            return new_state
+
+        methods['get_possible_actions'] = staticmethod(expand)
+        methods['take_action'] = staticmethod(act)
+        return type(game.__name__, (game,), methods)
+
+    def _timed(self, name: str, function: Callable) -> Callable:
+        """Wrap a function so its calls are counted and timed."""
+        calls = self.calls
+        seconds = self.seconds
+        clock = time.perf_counter
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[name] += clock() - start
+                calls[name] += 1
+
+        return timed
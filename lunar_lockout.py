@@ -1,53 +1,89 @@
-import csv
 import math
-from typing import Dict, List, Optional, Tuple
-from share import direction_deltas, direction_map, directions
+from typing import Dict, Iterator, List, Optional, Tuple
+from share import (
+    coordinate_width, direction_map, directions, parse_positions,
+    position_string, read_rows)
 
 Action = Tuple[int, str]  # robot index and direction
 Position = Tuple[int, int]  # column and row one-based indexes
-State = List[Position]  # list of robot positions
+Robots = List[Position]  # list of robot positions
+
+# A State packs the cell of each robot into CELL_BITS bits,
+# starting with the red robot in the lowest bits.
+# Cells are numbered row by row from zero in the upper-left corner.
+# Robots that are not on the board are in cell ABSENT.
+# Being an int, a State is its own key in a set of visited States.
+State = int
 
 DEBUG = False
+
+# The board has SIZE rows and SIZE columns.
+# Call set_size to change it and the values and tables derived from it.
 SIZE = 5
 CENTER = math.ceil(SIZE / 2)
 TARGET = '#'
 
+# Enough bits for every cell and ABSENT, which is the highest value.
+CELL_BITS = (SIZE * SIZE).bit_length()
+CELL_MASK = (1 << CELL_BITS) - 1
+ABSENT = CELL_MASK
+CENTER_CELL = (CENTER - 1) * SIZE + CENTER - 1
+
+# Mask for the SIZE cells of one row or column of the board.
+LANE_MASK = (1 << SIZE) - 1
+
 # Order of robots in State is same as order of robot_ids.
 robot_ids = ('R', 'O', 'Y', 'G', 'B', 'P')
 robot_names = ('red', 'orange', 'yellow', 'green', 'blue', 'purple')
 
+# A Slide describes how a robot in a given cell moves in a direction.
+# It holds the direction, whether the robot moves within its column
+# rather than its row, the shift that brings the occupancy bits of
+# that row or column down to the lowest bits, and a list indexed by
+# those bits giving the cell where the robot stops or None.
+Slide = Tuple[str, bool, int, List[Optional[int]]]
 
-def _can_move(robots: State, robot_index: int, direction: str) -> bool:
-    """Determine whether a robot can move in a direction in a given State."""
-    column, row = robots[robot_index]
+# Index of each direction in the Slides for a cell.
+direction_indexes = {direction: i for i, direction in enumerate(directions)}
 
-    can = False
-    for index, position in enumerate(robots):
-        if index == robot_index:
-            continue
-        c, r = position
 
-        adjacent: bool = \
-            (direction == 'U' and c == column and r == row - 1) or \
-            (direction == 'D' and c == column and r == row + 1) or \
-            (direction == 'L' and r == row and c == column - 1) or \
-            (direction == 'R' and r == row and c == column + 1)
-        if adjacent:
-            return False
+def _destination(
+        rows: int, columns: int, cell: int, direction: str) -> Optional[int]:
+    """Get the cell where a robot in a given cell stops
+    when it moves in a direction, or None if it cannot move that way.
+    rows has a bit set for each occupied cell numbered row by row and
+    columns has a bit set for each occupied cell numbered column by column.
+    """
+    row, column = divmod(cell, SIZE)
+    if direction in ('L', 'R'):
+        lane = (rows >> (row * SIZE)) & LANE_MASK
+        index = column
+    else:
+        lane = (columns >> (column * SIZE)) & LANE_MASK
+        index = row
 
-        blocks: bool = \
-            (direction == 'U' and c == column and r < row - 1) or \
-            (direction == 'D' and c == column and r > row + 1) or \
-            (direction == 'L' and r == row and c < column - 1) or \
-            (direction == 'R' and r == row and c > column + 1)
-        if blocks:
-            can = True
+    if direction in ('L', 'U'):
+        # The blocker is the highest occupied cell before the robot.
+        before = lane & ((1 << index) - 1)
+        if not before:
+            return None
+        stop = before.bit_length()  # one past the blocker
+        if stop == index:
+            return None  # the blocker is adjacent
+    else:
+        # The blocker is the lowest occupied cell after the robot.
+        after = lane >> (index + 1) << (index + 1)
+        if not after:
+            return None
+        stop = (after & -after).bit_length() - 2  # one before the blocker
+        if stop == index:
+            return None  # the blocker is adjacent
 
-    # print('game.py can_move: can =', can)
-    return can
+    return row * SIZE + stop if direction in ('L', 'R') \
+        else stop * SIZE + column
 
 
-def _get_cell(robots: State, column: int, row: int) -> str:
+def _get_cell(robots: Robots, column: int, row: int) -> str:
     """Get the character to print for a given board cell."""
     for index, position in enumerate(robots):
         c, r = position
@@ -57,12 +93,91 @@ def _get_cell(robots: State, column: int, row: int) -> str:
     return '#' if is_center else ' '
 
 
-def _make_position(x: str, y: str) -> Position:
-    """Create a Position from x and y string values."""
-    return (int(x), int(y))
+def _occupancy(state: State) -> Tuple[int, int]:
+    """Get masks of the occupied cells of a State,
+    first numbered row by row and then column by column."""
+    rows = columns = 0
+    for _ in robot_ids:
+        cell = state & CELL_MASK
+        if cell != ABSENT:
+            row, column = divmod(cell, SIZE)
+            rows |= 1 << cell
+            columns |= 1 << (column * SIZE + row)
+        state >>= CELL_BITS
+    return rows, columns
+
+
+def _make_slides() -> List[List[Slide]]:
+    """Build the Slides of a robot in each cell for each direction."""
+    slides = []
+    for cell in range(SIZE * SIZE):
+        row, column = divmod(cell, SIZE)
+        cell_slides = []
+        for direction in directions:
+            vertical = direction in ('U', 'D')
+            shift = (column if vertical else row) * SIZE
+            stops = [
+                _destination(0, lane << shift, cell, direction) if vertical
+                else _destination(lane << shift, 0, cell, direction)
+                for lane in range(LANE_MASK + 1)]
+            cell_slides.append((direction, vertical, shift, stops))
+        slides.append(cell_slides)
+    return slides
+
+
+def pack_robots(robots: Robots) -> State:
+    """Create a State from a list of robot positions.
+    Robots that are not on the board have the position (0, 0)."""
+    state = 0
+    for index, (column, row) in enumerate(robots):
+        cell = ABSENT if column == 0 else (row - 1) * SIZE + column - 1
+        state |= cell << (index * CELL_BITS)
+    return state
+
+
+def set_size(size: int) -> None:
+    """Change the number of rows and columns of the board and rebuild
+    the values and tables derived from it.
+    States made for the previous size are not valid afterward."""
+    # pylint: disable=W0603
+    global SIZE, CENTER, CELL_BITS, CELL_MASK, ABSENT, CENTER_CELL
+    global LANE_MASK, _slides
+    if size < 3:
+        raise ValueError('the board must have at least 3 rows and columns')
+    SIZE = size
+    CENTER = math.ceil(SIZE / 2)
+    CELL_BITS = (SIZE * SIZE).bit_length()
+    CELL_MASK = (1 << CELL_BITS) - 1
+    ABSENT = CELL_MASK
+    CENTER_CELL = (CENTER - 1) * SIZE + CENTER - 1
+    LANE_MASK = (1 << SIZE) - 1
+    _slides = _make_slides()
+
+
+def unpack_robots(state: State) -> Robots:
+    """Create a list of robot positions from a State."""
+    robots = []
+    for _ in robot_ids:
+        cell = state & CELL_MASK
+        if cell == ABSENT:
+            robots.append((0, 0))
+        else:
+            row, column = divmod(cell, SIZE)
+            robots.append((column + 1, row + 1))
+        state >>= CELL_BITS
+    return robots
+
+
+# The Slides for each cell in the order of directions,
+# built once so moves are found by table lookups.
+_slides = _make_slides()
 
 
 class LunarLockout:
+    # Change this when the rules or the State encoding change
+    # so stored solutions are not reused.
+    RULES_VERSION = 1
+
     @staticmethod
     def action_string(action: Action) -> str:
         """Get string representation of an Action."""
@@ -70,44 +185,88 @@ class LunarLockout:
         return robot_names[index] + ' ' + direction_map[direction]
 
     @staticmethod
-    def get_possible_actions(robots: State) -> List[Action]:
+    def board_size() -> Tuple[int, int]:
+        """Get the number of columns and rows of the board."""
+        return SIZE, SIZE
+
+    @staticmethod
+    def get_possible_actions(state: State) -> List[Action]:
         """Get all the possible actions that can be taken in a given State."""
+        rows, columns = _occupancy(state)
         actions = []
-        for robot_index in range(len(robots)):
-            for direction in directions:
-                if _can_move(robots, robot_index, direction):
+        for robot_index in range(len(robot_ids)):
+            cell = (state >> (robot_index * CELL_BITS)) & CELL_MASK
+            if cell == ABSENT:
+                continue
+            for direction, vertical, shift, stops in _slides[cell]:
+                lane = ((columns if vertical else rows) >> shift) & LANE_MASK
+                if stops[lane] is not None:
                     actions.append((robot_index, direction))
         return actions
 
+    @staticmethod
+    def heuristic(state: State) -> int:
+        """Estimate the number of Actions needed to solve a State
+        without overestimating it."""
+        cell = state & CELL_MASK  # red robot
+        if cell == CENTER_CELL:
+            return 0
+        # The red robot needs one move to reach the center if it is
+        # in line with it and would stop there, and at least two if not.
+        row, column = divmod(cell, SIZE)
+        if row == CENTER - 1:
+            direction = 'R' if column < CENTER - 1 else 'L'
+        elif column == CENTER - 1:
+            direction = 'D' if row < CENTER - 1 else 'U'
+        else:
+            return 2
+        rows, columns = _occupancy(state)
+        _, vertical, lane_shift, stops = \
+            _slides[cell][direction_indexes[direction]]
+        lane = ((columns if vertical else rows) >> lane_shift) & LANE_MASK
+        return 1 if stops[lane] == CENTER_CELL else 2
+
     @staticmethod
     def initialize() -> None:
         pass
 
     @staticmethod
-    def is_solved(robots: State) -> bool:
+    def is_solved(state: State) -> bool:
         """Determine if a State represents a solved puzzle."""
-        column, row = robots[0]  # red robot
-        return column == row == CENTER
+        return state & CELL_MASK == CENTER_CELL  # red robot
+
+    @staticmethod
+    def iter_puzzles(
+            path: str = 'lunar_lockout.csv') -> Iterator[Tuple[int, State]]:
+        """Yield the number and State of each puzzle in a file,
+        reading one row at a time; a path of '-' reads standard input.
+        Each coordinate has as many digits as SIZE."""
+        width = coordinate_width(SIZE)
+        for number, coords in read_rows(path):
+            # red, orange, yellow, green, blue and purple
+            robots = parse_positions(coords, width)
+            if len(robots) != len(robot_ids):
+                raise ValueError(
+                    f'puzzle {number} does not have'
+                    f' {len(robot_ids)} robots')
+            if any(not (1 <= column <= SIZE and 1 <= row <= SIZE)
+                   and (column, row) != (0, 0)
+                   for column, row in robots):
+                raise ValueError(
+                    f'puzzle {number} has a robot off the board')
+            yield int(number), pack_robots(robots)
 
     @staticmethod
-    def load_puzzles() -> Dict[int, State]:
-        """Load a set of puzzles from a file."""
-        puzzles = {}
-        with open('lunar_lockout.csv') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                number, coords = row
-                if not number.startswith('#'):
-                    robots = [
-                        _make_position(coords[0], coords[1]),  # red
-                        _make_position(coords[2], coords[3]),  # orange
-                        _make_position(coords[4], coords[5]),  # yellow
-                        _make_position(coords[6], coords[7]),  # green
-                        _make_position(coords[8], coords[9]),  # blue
-                        _make_position(coords[10], coords[11])  # purple
-                    ]
-                    puzzles[int(number)] = robots
-        return puzzles
+    def key_bits() -> int:
+        """Get the most bits in the state_key of a State
+        on the current board."""
+        return len(robot_ids) * CELL_BITS
+
+    @staticmethod
+    def load_puzzles(path: str = 'lunar_lockout.csv') -> Dict[int, State]:
+        """Load a set of puzzles from a file.
+        Each coordinate has as many digits as SIZE."""
+        return dict(LunarLockout.iter_puzzles(path))
 
     @staticmethod
     def print_actions(label: str, actions: List[Action]) -> None:
@@ -117,8 +276,9 @@ class LunarLockout:
             print('  ', LunarLockout.action_string(action))
 
     @staticmethod
-    def print_state(robots: State) -> None:
+    def print_state(state: State) -> None:
         """Print a State."""
+        robots = unpack_robots(state)
         border = '+---' * SIZE + '+'
         for row in range(1, SIZE + 1):
             print(border)
@@ -129,51 +289,47 @@ class LunarLockout:
         print(border)
 
     @staticmethod
-    def state_string(robots: State) -> str:
+    def puzzle_row(state: State) -> List[str]:
+        """Get the fields after the puzzle number that describe a State
+        in a puzzle file read by iter_puzzles."""
+        return [LunarLockout.state_string(state)]
+
+    @staticmethod
+    def state_key(state: State) -> State:
+        """Get the value that identifies a State in a set of visited States."""
+        return state
+
+    @staticmethod
+    def state_string(state: State) -> str:
         """Get the string representation of a State."""
-        return ''.join(map(lambda pos: f'{pos[0]}{pos[1]}', robots))
+        width = coordinate_width(SIZE)
+        return ''.join(position_string(position, width)
+                       for position in unpack_robots(state))
 
     @staticmethod
-    def take_action(robots: State, action: Action) -> State:
-        """Take an Action on a State and return a new State."""
-        # print('.', end='')  # print a dot for each action attempted
+    def take_action(
+            state: State, action: Action, validate: bool = True) -> State:
+        """Take an Action on a State and return a new State.
+        Finding where the robot stops also checks that the Action is possible,
+        so validate is only accepted for compatibility with the other games."""
 
         robot_index, direction = action
 
         if DEBUG:
             print('moving', robot_names[robot_index], direction_map[direction])
 
-        column, row = robots[robot_index]
+        shift = robot_index * CELL_BITS
+        cell = (state >> shift) & CELL_MASK
+        destination = None
+        if cell != ABSENT:
+            rows, columns = _occupancy(state)
+            _, vertical, lane_shift, stops = \
+                _slides[cell][direction_indexes[direction]]
+            lane = ((columns if vertical else rows) >> lane_shift) & LANE_MASK
+            destination = stops[lane]
 
-        # Find the closest robot that will block the move.
-        blocker: Optional[Position] = None
-        # Avoid the false positive error about
-        # blocker being an unsubscriptable object.
-        # pylint: disable=E1136
-        for index, position in enumerate(robots):
-            if index == robot_index:
-                continue
-            c, r = position
-
-            if direction == 'U' and c == column and r < row - 1:
-                if blocker is None or r > blocker[1]:
-                    blocker = position
-            elif direction == 'D' and c == column and r > row + 1:
-                if blocker is None or r < blocker[1]:
-                    blocker = position
-            elif direction == 'L' and r == row and c < column - 1:
-                if blocker is None or c > blocker[0]:
-                    blocker = position
-            elif direction == 'R' and r == row and c > column + 1:
-                if blocker is None or c < blocker[0]:
-                    blocker = position
-
-        if blocker is None:
+        if destination is None:
             raise ValueError(
                 'invalid move ' + LunarLockout.action_string(action))
 
-        new_robots = robots.copy()
-        c, r = blocker
-        dx, dy = direction_deltas[direction]
-        new_robots[robot_index] = (c - dx, r - dy)
-        return new_robots
+        return state & ~(CELL_MASK << shift) | destination << shift
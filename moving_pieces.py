@@ -1,22 +1,36 @@
-import csv
-import sys
-from typing import Dict, List, Tuple
-from share import direction_map, directions
+from typing import Dict, Iterator, List, Tuple
+from share import (
+    coordinate_width, direction_deltas, direction_map, directions,
+    parse_positions, position_string, read_rows)
 
 Action = Tuple[str, str]  # piece id and direction
 Board = List[List[str]]  # outer array holds rows; inner arrays hold columns
 Position = Tuple[int, int]  # column and row one-based indexes
-State = Dict[str, Position]  # keys are piece ids and values are positions
-
+Positions = Dict[str, Position]  # keys are piece ids and values are positions
+
+# Cells are numbered row by row from zero in the upper-left corner.
+# A State holds the cell of the upper-left corner of each piece
+# in the order of piece_ids, a mask with a bit set
+# for each occupied cell and the key of the State.
+# The mask and key are kept in sync with the cells.
+Cells = Tuple[int, ...]
+State = Tuple[Cells, int, int]
+
+# Call set_size to change the size of the board
+# and the values and tables derived from it.
 COLUMNS = 5
 ROWS = 4
 SINGLE_PIECES = ['B', 'C']
 VERTICAL_PIECES = ['F', 'G', 'H', 'J']
 
-sys.setrecursionlimit(10**5)  # 10**4 is not enough
+# The puzzle is solved when these pieces are at these positions,
+# regardless of where the other pieces are.
+# Piece A is in the upper-right corner.
+SOLVED_POSITIONS = {'A': (COLUMNS - 1, 1), 'D': (1, 1), 'E': (1, 2)}
 
 # Order of pieces in State is same as order of piece_ids.
 piece_ids = list('ABCDEFGHJ')
+piece_indexes = {piece_id: i for i, piece_id in enumerate(piece_ids)}
 
 piece_sizes = {
     'A': (2, 2),  # width, height
@@ -30,39 +44,39 @@ piece_sizes = {
     'J': (1, 2)
 }
 
+# A State key holds the cells of pieces A, D and E in CELL_BITS bits each
+# followed by a mask of the cells holding pieces B and C
+# and a mask of the upper cells holding pieces F through J.
+# Swapping interchangeable pieces doesn't change the masks,
+# so such States share a key.
+CELL_BITS = (COLUMNS * ROWS - 1).bit_length()
+SINGLES_SHIFT = 3 * CELL_BITS
+VERTICALS_SHIFT = SINGLES_SHIFT + COLUMNS * ROWS
 
-def _can_move(state: State, piece_id: str, direction: str) -> bool:
-    """Determine whether a piece can move in a direction in a given State."""
-    # Get the one or two cells that are the target of the move.
-    target_cells: List[Position] = []
+# A Move describes how a piece in a given cell moves in a direction.
+# It holds a mask of the cells the piece moves into, which must be empty,
+# and the cell the piece moves to.
+Move = Tuple[int, int]
 
-    column, row = state[piece_id]
-    width, height = piece_sizes[piece_id]
 
-    if direction == 'L' and column > 1:
-        target_cells = [(column - 1, row + i)
-                        for i in range(height)]
-    elif direction == 'R' and column + width <= COLUMNS:
-        target_cells = [(column + width, row + i)
-                        for i in range(height)]
-    elif direction == 'D' and row + height <= ROWS:
-        target_cells = [(column + i, row + height)
-                        for i in range(width)]
-    elif direction == 'U' and row > 1:
-        target_cells = [(column + i, row - 1)
-                        for i in range(width)]
+def _can_move(state: State, piece_id: str, direction: str) -> bool:
+    """Determine whether a piece can move in a direction in a given State."""
+    cells, occupied, _ = state
+    index = piece_indexes[piece_id]
+    move = _moves[index][cells[index]].get(direction)
+    return move is not None and not occupied & move[0]
 
-    if not target_cells:
-        return False
 
-    # Determine if the target cells are empty.
-    return all(map(lambda cell: _is_empty(state, cell), target_cells))
+def _cell(position: Position) -> int:
+    """Get the number of the cell at a Position."""
+    column, row = position
+    return (row - 1) * COLUMNS + column - 1
 
 
 def _get_board(state: State) -> Board:
     """Get the character to print for a given board cell."""
     board = [[' '] * COLUMNS for _ in range(ROWS)]
-    for piece_id, position in state.items():
+    for piece_id, position in unpack_positions(state).items():
         column, row = position
         width, height = piece_sizes[piece_id]
         for c in range(width):
@@ -71,54 +85,205 @@ def _get_board(state: State) -> Board:
     return board
 
 
-def _is_empty(state: State, cell: Position) -> bool:
-    c, r = cell
-    # If any piece occupies this cell then it is not empty.
-    for piece_id, position in state.items():
-        column, row = position
+def _make_key_bits() -> List[List[int]]:
+    """Build the bits each piece contributes to a State key
+    when its upper-left corner is in each cell."""
+    all_bits = []
+    for piece_id in piece_ids:
+        bits = []
+        for cell in range(COLUMNS * ROWS):
+            if piece_id in SINGLE_PIECES:
+                bits.append(1 << (SINGLES_SHIFT + cell))
+            elif piece_id in VERTICAL_PIECES:
+                bits.append(1 << (VERTICALS_SHIFT + cell))
+            else:
+                shift = CELL_BITS * ['A', 'D', 'E'].index(piece_id)
+                bits.append(cell << shift)
+        all_bits.append(bits)
+    return all_bits
+
+
+def _make_moves() -> List[List[Dict[str, Move]]]:
+    """Build the Moves of each piece in each cell for each direction."""
+    moves = []
+    for index in range(len(piece_ids)):
+        masks = _piece_masks[index]
+        piece_moves = []
+        for cell, mask in enumerate(masks):
+            cell_moves = {}
+            if mask:
+                column, row = _position(cell)
+                for direction in directions:
+                    dx, dy = direction_deltas[direction]
+                    if 1 <= column + dx <= COLUMNS and 1 <= row + dy <= ROWS:
+                        new_cell = _cell((column + dx, row + dy))
+                        new_mask = masks[new_cell]
+                        if new_mask:
+                            cell_moves[direction] = \
+                                (new_mask & ~mask, new_cell)
+            piece_moves.append(cell_moves)
+        moves.append(piece_moves)
+    return moves
+
+
+def _make_piece_masks() -> List[List[int]]:
+    """Build the mask of the cells covered by each piece
+    with its upper-left corner in each cell,
+    or 0 if the piece does not fit on the board there."""
+    all_masks = []
+    for piece_id in piece_ids:
         width, height = piece_sizes[piece_id]
-        if column <= c < column + width and row <= r < row + height:
-            return False
-    return True
+        masks = []
+        for cell in range(COLUMNS * ROWS):
+            column, row = _position(cell)
+            if column + width - 1 > COLUMNS or row + height - 1 > ROWS:
+                masks.append(0)
+                continue
+            mask = 0
+            for c in range(width):
+                for r in range(height):
+                    mask |= 1 << _cell((column + c, row + r))
+            masks.append(mask)
+        all_masks.append(masks)
+    return all_masks
+
+
+def _make_solved_cells() -> Dict[int, int]:
+    """Get the cells where the pieces in SOLVED_POSITIONS must be,
+    by piece index."""
+    return {piece_indexes[piece_id]: _cell(position)
+            for piece_id, position in SOLVED_POSITIONS.items()}
+
+
+def _position(cell: int) -> Position:
+    """Get the Position of a cell number."""
+    row, column = divmod(cell, COLUMNS)
+    return (column + 1, row + 1)
+
+
+def pack_positions(positions: Positions) -> State:
+    """Create a State from the positions of all the pieces."""
+    cells = tuple(_cell(positions[piece_id]) for piece_id in piece_ids)
+    occupied = key = 0
+    for index, cell in enumerate(cells):
+        occupied |= _piece_masks[index][cell]
+        key |= _key_bits[index][cell]
+    return cells, occupied, key
+
+
+def set_size(columns: int, rows: int) -> None:
+    """Change the number of columns and rows of the board and rebuild
+    the values and tables derived from it.
+    States made for the previous size are not valid afterward."""
+    # pylint: disable=W0603
+    global COLUMNS, ROWS, SOLVED_POSITIONS
+    global CELL_BITS, SINGLES_SHIFT, VERTICALS_SHIFT
+    global _piece_masks, _moves, _key_bits, _solved_cells
+    cells = sum(width * height for width, height in piece_sizes.values())
+    if columns < 4 or rows < 2 or columns * rows <= cells:
+        raise ValueError(
+            'the board needs at least 4 columns, 2 rows'
+            f' and more than {cells} cells')
+    COLUMNS = columns
+    ROWS = rows
+    SOLVED_POSITIONS = {'A': (COLUMNS - 1, 1), 'D': (1, 1), 'E': (1, 2)}
+    CELL_BITS = (COLUMNS * ROWS - 1).bit_length()
+    SINGLES_SHIFT = 3 * CELL_BITS
+    VERTICALS_SHIFT = SINGLES_SHIFT + COLUMNS * ROWS
+    _piece_masks = _make_piece_masks()
+    _moves = _make_moves()
+    _key_bits = _make_key_bits()
+    _solved_cells = _make_solved_cells()
+
+
+def unpack_positions(state: State) -> Positions:
+    """Get the positions of all the pieces in a State."""
+    cells = state[0]
+    return {piece_id: _position(cell)
+            for piece_id, cell in zip(piece_ids, cells)}
+
+
+# These are built once so moves are found by table lookups.
+# All are indexed by piece index and then by cell.
+_piece_masks = _make_piece_masks()
+_moves = _make_moves()
+_key_bits = _make_key_bits()
+_solved_cells = _make_solved_cells()
 
 
 class MovingPieces:
+    # Change this when the rules or the State encoding change
+    # so stored solutions are not reused.
+    RULES_VERSION = 1
+
     @staticmethod
     def action_string(action: Action) -> str:
         """Get string representation of an Action."""
         piece_id, direction = action
         return piece_id + ' ' + direction_map[direction]
 
+    @staticmethod
+    def board_size() -> Tuple[int, int]:
+        """Get the number of columns and rows of the board."""
+        return COLUMNS, ROWS
+
     @staticmethod
     def get_possible_actions(state: State) -> List[Action]:
         """Get all the possible actions that can be taken in a given State."""
+        cells, occupied, _ = state
         actions: List[Action] = []
-        for piece_id, position in state.items():
-            column, row = position
-            width, height = piece_sizes[piece_id]
-            for direction in directions:
-                # Get the one or two cells that are the target of the move.
-                target_cells: List[Position] = []
-
-                if direction == 'L' and column > 1:
-                    target_cells = [(column - 1, row + i)
-                                    for i in range(height)]
-                elif direction == 'R' and column + width <= COLUMNS:
-                    target_cells = [(column + width, row + i)
-                                    for i in range(height)]
-                elif direction == 'D' and row + height <= ROWS:
-                    target_cells = [(column + i, row + height)
-                                    for i in range(width)]
-                elif direction == 'U' and row > 1:
-                    target_cells = [(column + i, row - 1)
-                                    for i in range(width)]
-                if not target_cells:
-                    continue
-                # If those cells are open ...
-                if all(map(lambda cell: _is_empty(state, cell), target_cells)):
-                    actions.append((piece_id, direction))
+        for index, cell in enumerate(cells):
+            for direction, (entered, _) in _moves[index][cell].items():
+                # If the cells being moved into are open ...
+                if not occupied & entered:
+                    actions.append((piece_ids[index], direction))
         return actions
 
+    @staticmethod
+    def get_solved_states() -> List[State]:
+        """Get every State in which the puzzle is solved.
+        States that only differ by swapping interchangeable pieces
+        are only included once."""
+        states: Dict[int, State] = {}
+        cells = [0] * len(piece_ids)
+
+        def place(occupied: int, key: int, index: int) -> None:
+            if index == len(piece_ids):
+                states.setdefault(key, (tuple(cells), occupied, key))
+                return
+
+            if index in _solved_cells:
+                place(occupied, key, index + 1)
+                return
+
+            for cell, mask in enumerate(_piece_masks[index]):
+                if mask and not occupied & mask:
+                    cells[index] = cell
+                    place(occupied | mask, key | _key_bits[index][cell],
+                          index + 1)
+
+        occupied = key = 0
+        for index, cell in _solved_cells.items():
+            cells[index] = cell
+            occupied |= _piece_masks[index][cell]
+            key |= _key_bits[index][cell]
+        place(occupied, key, 0)
+        return list(states.values())
+
+    @staticmethod
+    def heuristic(state: State) -> int:
+        """Estimate the number of Actions needed to solve a State
+        without overestimating it."""
+        # Each Action moves one piece by one cell, so at least the sum of
+        # the distances of the pinned pieces from their targets is needed.
+        cells = state[0]
+        distance = 0
+        for index, target in _solved_cells.items():
+            row, column = divmod(cells[index], COLUMNS)
+            target_row, target_column = divmod(target, COLUMNS)
+            distance += abs(column - target_column) + abs(row - target_row)
+        return distance
+
     @staticmethod
     def initialize() -> None:
         pass
@@ -126,24 +291,51 @@ class MovingPieces:
     @staticmethod
     def is_solved(state: State) -> bool:
         """Determine if a State represents a solved puzzle."""
-        return state['A'] == (4, 1) and state['D'] == (1, 1) and state['E'] == (1, 2)
-
-    @staticmethod
-    def load_puzzles() -> Dict[int, State]:
-        """Load a set of puzzles from a file."""
-        puzzles = {}
-        with open('moving_pieces.csv') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                number, coords = row
-                if not number.startswith('#'):
-                    state = {}
-                    for i, piece_id in enumerate(piece_ids):
-                        ci = i * 2
-                        state[piece_id] = (
-                            int(coords[ci]), int(coords[ci + 1]))
-                    puzzles[int(number)] = state
-        return puzzles
+        cells = state[0]
+        return all(cells[index] == cell
+                   for index, cell in _solved_cells.items())
+
+    @staticmethod
+    def iter_puzzles(
+            path: str = 'moving_pieces.csv') -> Iterator[Tuple[int, State]]:
+        """Yield the number and State of each puzzle in a file,
+        reading one row at a time; a path of '-' reads standard input.
+        Each coordinate has as many digits as the larger of
+        COLUMNS and ROWS."""
+        width = coordinate_width(max(COLUMNS, ROWS))
+        for number, coords in read_rows(path):
+            positions = parse_positions(coords, width)
+            if len(positions) != len(piece_ids):
+                raise ValueError(
+                    f'puzzle {number} does not have'
+                    f' {len(piece_ids)} pieces')
+            occupied = 0
+            for index, (column, row) in enumerate(positions):
+                width, height = piece_sizes[piece_ids[index]]
+                if not (1 <= column <= COLUMNS - width + 1
+                        and 1 <= row <= ROWS - height + 1):
+                    raise ValueError(
+                        f'puzzle {number} has a piece off the board')
+                mask = _piece_masks[index][_cell((column, row))]
+                if occupied & mask:
+                    raise ValueError(
+                        f'puzzle {number} has overlapping pieces')
+                occupied |= mask
+            yield int(number), pack_positions(
+                dict(zip(piece_ids, positions)))
+
+    @staticmethod
+    def key_bits() -> int:
+        """Get the most bits in the state_key of a State
+        on the current board."""
+        return VERTICALS_SHIFT + COLUMNS * ROWS
+
+    @staticmethod
+    def load_puzzles(path: str = 'moving_pieces.csv') -> Dict[int, State]:
+        """Load a set of puzzles from a file.
+        Each coordinate has as many digits as the larger of
+        COLUMNS and ROWS."""
+        return dict(MovingPieces.iter_puzzles(path))
 
     @staticmethod
     def print_actions(label: str, actions: List[Action]) -> None:
@@ -177,44 +369,59 @@ class MovingPieces:
             print('| ' + ' | '.join(board[row]) + ' |')
         print(border)
 
+    @staticmethod
+    def puzzle_row(state: State) -> List[str]:
+        """Get the fields after the puzzle number that describe a State
+        in a puzzle file read by iter_puzzles."""
+        positions = unpack_positions(state)
+        width = coordinate_width(max(COLUMNS, ROWS))
+        return [''.join(position_string(positions[piece_id], width)
+                        for piece_id in piece_ids)]
+
+    @staticmethod
+    def state_key(state: State) -> int:
+        """Get the value that identifies a State in a set of visited States."""
+        return state[2]
+
     @staticmethod
     def state_string(state: State) -> str:
         """Get the string representation of a State."""
+        positions = unpack_positions(state)
+        width = coordinate_width(max(COLUMNS, ROWS))
 
-        def position_string(piece_id: str) -> str:
-            column, row = state[piece_id]
-            return f'{column}{row}'
+        def piece_string(piece_id: str) -> str:
+            return position_string(positions[piece_id], width)
 
-        s_positions: List[str] = list(map(position_string, SINGLE_PIECES))
-        v_positions: List[str] = list(map(position_string, VERTICAL_PIECES))
+        s_positions: List[str] = list(map(piece_string, SINGLE_PIECES))
+        v_positions: List[str] = list(map(piece_string, VERTICAL_PIECES))
         s_positions.sort()
         v_positions.sort()
-        return position_string('A') \
-            + position_string('D') \
-            + position_string('E') \
+        return piece_string('A') \
+            + piece_string('D') \
+            + piece_string('E') \
             + ''.join(s_positions) \
             + ''.join(v_positions)
 
     @staticmethod
-    def take_action(state: State, action: Action) -> State:
-        """Take an Action on a State and return a new State."""
-        # print('.', end='')  # print a dot for each action attempted
+    def take_action(
+            state: State, action: Action, validate: bool = True) -> State:
+        """Take an Action on a State and return a new State.
+        Callers that got the Action from get_possible_actions
+        can pass False for validate to skip checking that it is possible."""
 
-        new_state = state.copy()
         piece_id, direction = action
 
-        if not _can_move(state, piece_id, direction):
+        if validate and not _can_move(state, piece_id, direction):
             raise ValueError(
                 'invalid move ' + MovingPieces.action_string(action))
 
-        column, row = state[piece_id]
-        if direction == 'L':
-            new_state[piece_id] = (column - 1, row)
-        elif direction == 'R':
-            new_state[piece_id] = (column + 1, row)
-        elif direction == 'U':
-            new_state[piece_id] = (column, row - 1)
-        elif direction == 'D':
-            new_state[piece_id] = (column, row + 1)
-
-        return new_state
+        cells, occupied, key = state
+        index = piece_indexes[piece_id]
+        cell = cells[index]
+        _, new_cell = _moves[index][cell][direction]
+        masks = _piece_masks[index]
+        bits = _key_bits[index]
+        new_cells = cells[:index] + (new_cell,) + cells[index + 1:]
+        return (new_cells,
+                occupied ^ masks[cell] ^ masks[new_cell],
+                key ^ bits[cell] ^ bits[new_cell])
@@ -0,0 +1,305 @@
+import contextlib
+import importlib
+import inspect
+import math
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import (
+    Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set,
+    Tuple, Union)
+from solver import GameClass, Result, _path, solve_with_budget
+
+# Fewest States that parallel_bfs sends to a worker process at once.
+# Smaller layers are expanded in the main process.
+MIN_CHUNK_SIZE = 256
+
+# Puzzles solve_stream keeps in flight for each worker process.
+STREAM_WINDOW_PER_WORKER = 4
+
+# Puzzle number and the Result of solving it.
+NumberedResult = Tuple[int, Result]
+
+# Puzzle number, State and either its Result or a Future that will hold it.
+Pending = Tuple[int, Any, Union[Result, Future]]
+
+# A State generated by a worker process.
+# It holds the index of its parent in the chunk of States sent to the worker,
+# the Action that produced it, the State, its key and
+# whether it is solved.
+Successor = Tuple[int, Any, Any, Any, bool]
+
+# Keys of the States visited so far by the parallel_bfs search
+# a worker process is taking part in.
+_visited_keys: Set[Any] = set()
+
+
+def worker_pool(
+        game: GameClass, workers: Optional[int]) -> ProcessPoolExecutor:
+    """Make a pool of worker processes whose game module uses
+    the current board size of a game.
+    set_size only changes the process that calls it, and worker processes
+    that are spawned rather than forked import the module afresh."""
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=_set_board_size,
+        initargs=(game, game.board_size()))
+
+
+def _set_board_size(game: GameClass, size: Tuple[int, int]) -> None:
+    """Give the game module of a worker process a board size."""
+    if game.board_size() == size:
+        return
+    for cls in game.__mro__:
+        module = importlib.import_module(cls.__module__)
+        if hasattr(module, 'set_size'):
+            # Square boards are set by a single size.
+            count = len(inspect.signature(module.set_size).parameters)
+            module.set_size(*size[:count])
+            return
+
+
+def _expand_chunk(
+        game: GameClass,
+        new_keys: List[Any],
+        states: List[Any]) -> List[Successor]:
+    """Add the keys of the States visited since the last call
+    to the visited keys of a worker process and generate
+    the Successors of a chunk of States that are not among them."""
+    _visited_keys.update(new_keys)
+    return _new_successors(game, states, _visited_keys)
+
+
+def _new_successors(
+        game: GameClass,
+        states: List[Any],
+        visited: Set[Any]) -> List[Successor]:
+    """Generate the Successors of a chunk of States whose keys
+    are not in a set of visited keys, each State only once."""
+    successors = []
+    seen = set()
+    for index, state in enumerate(states):
+        for action in game.get_possible_actions(state):
+            new_state = game.take_action(state, action, validate=False)
+            key = game.state_key(new_state)
+            if key in visited or key in seen:
+                continue
+            seen.add(key)
+            successors.append(
+                (index, action, new_state, key, game.is_solved(new_state)))
+    return successors
+
+
+def _solve_one(
+        game: GameClass,
+        engine: str,
+        state: Any,
+        max_nodes: Optional[int] = None,
+        max_seconds: Optional[float] = None) -> Result:
+    """Solve a single puzzle in a worker process."""
+    game.initialize()
+    return solve_with_budget(state, game, engine, max_nodes, max_seconds)
+
+
+def _solve_record(
+        game: GameClass,
+        path: str,
+        index: int,
+        engine: str,
+        max_nodes: Optional[int],
+        max_seconds: Optional[float]) -> Result:
+    """Solve the puzzle at an index of a corpus file in a worker process."""
+    from corpus import open_corpus  # pylint: disable=C0415
+    _, state = open_corpus(path, game)[index]
+    return _solve_one(game, engine, state, max_nodes, max_seconds)
+
+
+def parallel_bfs(
+        state: Any, game: GameClass, workers: Optional[int] = None) -> Result:
+    """Solve a puzzle with given starting State using a breadth-first search
+    that expands each layer of States in worker processes.
+    workers defaults to the number of CPUs.
+    Each worker process keeps its own copy of the visited keys,
+    which it is sent the new keys of every layer to update,
+    so it only sends back the States that have not been visited.
+    The main process removes those found by more than one worker,
+    so this finds the same shortest solution as solver.solve."""
+    stats = {'expanded': 0, 'peak_frontier': 1, 'layers': 0}
+    if game.is_solved(state):
+        return [], stats
+
+    workers = workers or os.cpu_count() or 1
+    visited_states: Set[Any] = {game.state_key(state)}
+    # Keys visited since the worker processes were last sent a chunk.
+    new_keys = list(visited_states)
+
+    # Parent pointers are kept in two lists indexed by node number.
+    # The start node is number 0.
+    parents = [-1]
+    actions: List[Any] = [None]
+    frontier = [(state, 0)]
+    with contextlib.ExitStack() as stack:
+        # A pool of one process per worker sends every chunk
+        # to the process holding that worker's visited keys.
+        pools = [stack.enter_context(worker_pool(game, 1))
+                 for _ in range(workers)]
+        while frontier:
+            stats['layers'] += 1
+            stats['expanded'] += len(frontier)
+            size = max(MIN_CHUNK_SIZE, math.ceil(len(frontier) / workers))
+            chunks = [frontier[i:i + size]
+                      for i in range(0, len(frontier), size)]
+            chunk_states = [[s for s, _ in chunk] for chunk in chunks]
+            if len(chunks) == 1:
+                results = [_new_successors(
+                    game, chunk_states[0], visited_states)]
+            else:
+                # Every worker process gets the new keys,
+                # even those with no States to expand in this layer.
+                futures = [
+                    pool.submit(_expand_chunk, game, new_keys,
+                                chunk_states[i] if i < len(chunks) else [])
+                    for i, pool in enumerate(pools)]
+                results = [future.result() for future in futures]
+                new_keys = []
+
+            next_frontier = []
+            for chunk, successors in zip(chunks, results):
+                for index, action, new_state, key, solved in successors:
+                    if key in visited_states:
+                        continue
+                    visited_states.add(key)
+                    new_keys.append(key)
+                    parents.append(chunk[index][1])
+                    actions.append(action)
+                    child = len(parents) - 1
+                    if solved:
+                        return _path(parents, actions, child), stats
+                    next_frontier.append((new_state, child))
+            frontier = next_frontier
+            stats['peak_frontier'] = max(
+                stats['peak_frontier'], len(frontier))
+
+    return None, stats
+
+
+def solve_batch(
+        game: GameClass,
+        puzzles: Dict[int, Any],
+        engine: str = 'bfs',
+        workers: Optional[int] = None,
+        ordered: bool = False,
+        max_nodes: Optional[int] = None,
+        max_seconds: Optional[float] = None) -> Iterator[NumberedResult]:
+    """Solve puzzles of a game in a pool of worker processes,
+    yielding each puzzle number with its Result.
+    workers defaults to the number of CPUs.
+    max_nodes and max_seconds limit the search of each puzzle
+    as in solver.solve_with_budget.
+    Results are yielded as soon as they are found unless ordered is True,
+    in which case they are yielded in the order of the puzzle numbers.
+    Every worker has its own copy of each module,
+    so no search state is shared between puzzles."""
+    numbers = sorted(puzzles)
+    with worker_pool(game, workers) as executor:
+        if ordered:
+            results = executor.map(
+                _solve_one,
+                [game] * len(numbers),
+                [engine] * len(numbers),
+                [puzzles[number] for number in numbers],
+                [max_nodes] * len(numbers),
+                [max_seconds] * len(numbers))
+            yield from zip(numbers, results)
+        else:
+            futures = {
+                executor.submit(
+                    _solve_one, game, engine, puzzles[number],
+                    max_nodes, max_seconds): number
+                for number in numbers}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+
+def solve_corpus(
+        game: GameClass,
+        path: str,
+        indexes: Iterable[int],
+        engine: str = 'bfs',
+        workers: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        lookup: Optional[Callable[[Any], Optional[Result]]] = None
+) -> Iterator[Tuple[int, Any, Result]]:
+    """Solve the puzzles at given indexes of a corpus file
+    like solve_stream, but send each worker only the index of a puzzle.
+    Workers map the file once and read the records they are given
+    from the mapping instead of receiving pickled States."""
+    from corpus import open_corpus  # pylint: disable=C0415
+    corpus = open_corpus(path, game)
+    workers = workers or os.cpu_count() or 1
+    with worker_pool(game, workers) as executor:
+
+        def submit(index: int) -> Pending:
+            number, state = corpus[index]
+            result = lookup(state) if lookup else None
+            return number, state, result or executor.submit(
+                _solve_record, game, path, index, engine,
+                max_nodes, max_seconds)
+
+        yield from _in_order(
+            map(submit, indexes), STREAM_WINDOW_PER_WORKER * workers)
+
+
+def solve_stream(
+        game: GameClass,
+        puzzles: Iterable[Tuple[int, Any]],
+        engine: str = 'bfs',
+        workers: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        lookup: Optional[Callable[[Any], Optional[Result]]] = None
+) -> Iterator[Tuple[int, Any, Result]]:
+    """Solve puzzles of a game given as puzzle numbers and States
+    in a pool of worker processes, yielding each puzzle number
+    with its State and Result in the order they were given.
+    Unlike solve_batch, puzzles are taken from the iterable only
+    as workers become free, so any number of puzzles can be solved
+    with the memory of a few of them.
+    If lookup is given, it is called with each State and a Result
+    it returns is used instead of solving the puzzle.
+    max_nodes and max_seconds limit the search of each puzzle
+    as in solver.solve_with_budget."""
+    workers = workers or os.cpu_count() or 1
+    with worker_pool(game, workers) as executor:
+
+        def submit(puzzle: Tuple[int, Any]) -> Pending:
+            number, state = puzzle
+            result = lookup(state) if lookup else None
+            return number, state, result or executor.submit(
+                _solve_one, game, engine, state, max_nodes, max_seconds)
+
+        yield from _in_order(
+            map(submit, puzzles), STREAM_WINDOW_PER_WORKER * workers)
+
+
+def _in_order(
+        puzzles: Iterator[Pending],
+        window: int) -> Iterator[Tuple[int, Any, Result]]:
+    """Yield the number, State and Result of each puzzle in order,
+    waiting for those still being solved, while taking no more than
+    window puzzles from the iterator ahead of the one yielded."""
+    pending: Deque[Pending] = deque()
+    for puzzle in puzzles:
+        pending.append(puzzle)
+        while len(pending) >= window:
+            yield _resolve(pending.popleft())
+    while pending:
+        yield _resolve(pending.popleft())
+
+
+def _resolve(puzzle: Pending) -> Tuple[int, Any, Result]:
+    """Wait for the Result of a puzzle if it is still being solved."""
+    number, state, result = puzzle
+    if isinstance(result, Future):
+        result = result.result()
+    return number, state, result
@@ -1,3 +1,11 @@
+import csv
+import sys
+from typing import Iterator, List, Tuple
+
+# Puzzle files whose names end with this are corpus files,
+# which hold fixed-size binary records; see corpus.py.
+CORPUS_SUFFIX = '.pzc'
+
 # These are dx and dy values for directions.
 direction_deltas = {
     'D': (0, 1),
@@ -14,3 +22,38 @@ direction_map = {
 }
 
 directions = direction_map.keys()
+
+
+def coordinate_width(size: int) -> int:
+    """Get the number of digits used for each coordinate
+    in the puzzle files of a board with a given number of
+    rows or columns, whichever is larger."""
+    return len(str(size))
+
+
+def read_rows(path: str) -> Iterator[List[str]]:
+    """Yield the rows of a puzzle file one at a time, skipping blank rows
+    and comments, which start with '#'.
+    A path of '-' reads standard input."""
+    with (open(sys.stdin.fileno(), closefd=False) if path == '-'
+          else open(path)) as csvfile:
+        for row in csv.reader(csvfile):
+            if row and not row[0].startswith('#'):
+                yield row
+
+
+def parse_positions(coords: str, width: int) -> List[Tuple[int, int]]:
+    """Get the column and row of each position in a string
+    that holds them one after another, each coordinate
+    using width digits."""
+    step = 2 * width
+    if len(coords) % step:
+        raise ValueError(f'coordinates {coords!r} do not have {width} digits')
+    return [(int(coords[i:i + width]), int(coords[i + width:i + step]))
+            for i in range(0, len(coords), step)]
+
+
+def position_string(position: Tuple[int, int], width: int) -> str:
+    """Get the string that holds a position in a puzzle file."""
+    column, row = position
+    return f'{column:0{width}}{row:0{width}}'
@@ -1,108 +1,873 @@
-# global-statement: Using the global statement
-# pylint: disable=W0603
-
+import argparse
+import contextlib
+import heapq
+import importlib
+import json
+import math
+import os
 import sys
-from typing import List, Set
-#from lunar_lockout import Action, LunarLockout as Game, State
-from moving_pieces import Action, MovingPieces as Game, State
-#from tilt import Action, Tilt as Game, State
+import time
+from collections import deque
+from typing import (
+    Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set,
+    Tuple, Union)
+from compact_set import KEY_BITS, CompactSet
+from share import CORPUS_SUFFIX
 
 DEBUG = False
 
-solution = None
+# Name of the game main solves unless told otherwise; a key in GAMES.
+GAME = 'moving_pieces'
 
+# Name of the search engine used by main; a key in ENGINES.
+ENGINE = 'bfs'
 
-def optimize(state: State, actions: List[Action]) -> List[Action]:
-    """Look for unnecessary actions and remove them."""
-    # TODO: This works poorly for the MovingPieces puzzle!
-    # TODO: The solution it gives requires 572, but it can be solved in 59.
-    for i in range(len(actions) - 1):
-        # Create a copy of actions with the i'th action removed.
-        actions_copy = actions.copy()
-        del actions_copy[i]
+# Change this when the engines change the solutions they find
+# so stored solutions are not reused.
+ENGINE_VERSION = 1
 
-        try:
-            # Replay these actions.
-            state_copy = state.copy()
-            for action in actions_copy:
-                state_copy = Game.take_action(state_copy, action)
+# File where main stores solutions between runs, or None to not store them.
+CACHE_FILE: Optional[str] = 'solutions.sqlite'
 
-            # If the puzzle can be solved without that action,
-            # use these actions.
-            if Game.is_solved(state_copy):
-                return optimize(state, actions_copy)
-        except ValueError:
-            pass  # ignore since we are just trying alternate solutions
+# Whether main solves puzzles again even when solutions are stored.
+FORCE_SOLVE = False
 
-    return actions
+# Number of processes main uses to solve puzzles at the same time.
+WORKERS = 1
 
+# Whether main counts and times the calls each search makes
+# and reports them with the nodes expanded at each depth.
+# If PROFILE_FILE is also set, the searches are profiled with cProfile
+# and the statistics are written there for the pstats module.
+# Instrumented puzzles are solved one at a time in this process.
+INSTRUMENT = False
+PROFILE_FILE: Optional[str] = None
 
-def report() -> None:
-    global solution
-    if solution:
-        solution = optimize(state, solution)
-        Game.print_actions('Solution:', solution)
-    else:
-        print('No solution found.')
-        sys.exit(1)
+# Whether solve and dfs remember visited State keys in a CompactSet
+# rather than a set, and the most bytes it may use before spilling keys
+# into a Bloom filter (None for no limit).
+# A set is still used for games whose keys may not fit in 64 bits.
+COMPACT_VISITED = False
+VISITED_MAX_BYTES: Optional[int] = None
 
+# Most States remembered by each iteration of ida_star.
+IDA_TABLE_SIZE = 1 << 20
 
-def solve(state: State, actions_taken: List[Action]) -> None:
-    """Solve a puzzle with given starting State."""
-    global solution
+# Limits on the searches optimize makes for shortcuts
+# from each State on the path of a solution.
+SHORTCUT_DEPTH = 6
+SHORTCUT_STATES = 2000
 
-    if visited(state):
-        #print('solver.py solve: already visited')
-        return
+# A game is one of the classes LunarLockout, MovingPieces or Tilt.
+# Games are only imported when they are used, by load_game,
+# so their Action and State types are not known here.
+GameClass = Any
+Action = Any
+State = Any
+
+# The module and class name of each game, by the name used to select it.
+GAMES = {
+    'lunar_lockout': ('lunar_lockout', 'LunarLockout'),
+    'moving_pieces': ('moving_pieces', 'MovingPieces'),
+    'tilt': ('tilt', 'Tilt')
+}
+
+# Statistics describing a search, such as the number of nodes expanded.
+Stats = Dict[str, int]
+
+# The Actions that solve a puzzle (None if there are none)
+# and the statistics of the search that found them.
+Result = Tuple[Optional[List[Action]], Stats]
+
+# The keys of the States a search has visited.
+VisitedStates = Union[Set[Any], CompactSet]
+
+
+class BudgetExceeded(Exception):
+    """Raised when a search expands more nodes or takes more time
+    than solve_with_budget allows."""
+
+
+def _path(parents: List[int], actions: List[Any], node: int) -> List[Action]:
+    """Follow parent pointers from a node back to the start node
+    and return the Actions that lead from the start node to it."""
+    path = []
+    while node > 0:
+        path.append(actions[node])
+        node = parents[node]
+    path.reverse()
+    return path
 
-    if Game.is_solved(state):
-        solution = actions_taken
-        # print('solver.py solve: final board state is')
-        # Game.print_state(state)
-        return
 
-    #print('solver.py solve: actions_taken =', actions_taken)
-    #print('solver.py solve: state follows')
-    # Game.print_state(state)
-    new_actions = Game.get_possible_actions(state)
-    #print('solver.py solve: new_actions =', new_actions)
-    for action in new_actions:
-        if solution:
-            return
+def a_star(state: State, game: GameClass) -> Result:
+    """Solve a puzzle with given starting State using an A* search
+    guided by the heuristic method of the game.
+    This always finds a shortest solution because
+    every game heuristic underestimates the Actions remaining."""
+    stats = {'expanded': 0, 'peak_frontier': 1}
+    if game.is_solved(state):
+        return [], stats
+
+    # Parent pointers and depths are kept in lists indexed by node number.
+    # The start node is number 0.
+    parents = [-1]
+    actions: List[Any] = [None]
+    depths = [0]
+    best_depths = {game.state_key(state): 0}
+
+    # Entries hold the estimated solution length, the negated depth
+    # so deeper nodes are tried first, the node number and the State.
+    # Solved States are tested when they are reached rather than
+    # when they leave the frontier, and the search only goes on
+    # while an entry could still lead to a shorter solution.
+    frontier = [(game.heuristic(state), 0, 0, state)]
+    goal = -1
+    goal_depth = math.inf
+    while frontier:
+        estimate, _, node, state = heapq.heappop(frontier)
+        if estimate >= goal_depth:
+            break
+        depth = depths[node]
+        if best_depths[game.state_key(state)] < depth:
+            continue  # a shorter path to this State was found later
+
         if DEBUG:
-            Game.print_state(state)
-        #print('solver.py solve: trying =', action)
-        new_state = Game.take_action(state, action)
-        solve(new_state, [*actions_taken, action])  # recursive call
+            game.print_state(state)
+        stats['expanded'] += 1
+        for action in game.get_possible_actions(state):
+            new_state = game.take_action(state, action, validate=False)
+            key = game.state_key(new_state)
+            if best_depths.get(key, math.inf) <= depth + 1:
+                continue
+
+            best_depths[key] = depth + 1
+            parents.append(node)
+            actions.append(action)
+            depths.append(depth + 1)
+            if game.is_solved(new_state):
+                if depth + 1 < goal_depth:
+                    goal = len(parents) - 1
+                    goal_depth = depth + 1
+                continue
+            estimate = depth + 1 + game.heuristic(new_state)
+            heapq.heappush(
+                frontier, (estimate, -depth - 1, len(parents) - 1, new_state))
+        stats['peak_frontier'] = max(stats['peak_frontier'], len(frontier))
+
+    if goal < 0:
+        return None, stats
+    return _path(parents, actions, goal), stats
+
+
+def bidirectional(state: State, game: GameClass) -> Result:
+    """Solve a puzzle with given starting State by searching forward from it
+    and backward from every solved State at the same time
+    until the two searches meet.
+    This only works for games whose Actions can all be undone by
+    another Action and that can list their solved States
+    with get_solved_states. It always finds a shortest solution."""
+    if not hasattr(game, 'get_solved_states'):
+        raise ValueError(
+            game.__name__ + ' does not support bidirectional search')
+
+    stats = {
+        'expanded': 0,
+        'peak_frontier': 1,
+        'goal_states': 0,
+        'expanded_forward': 0,
+        'expanded_backward': 0,
+        'visited_forward': 1,
+        'visited_backward': 0
+    }
+
+    if game.is_solved(state):
+        return [], stats
+
+    # Each search maps State keys to node numbers and keeps
+    # parent pointers and depths in lists indexed by node number.
+    forward_nodes = {game.state_key(state): 0}
+    forward_parents = [-1]
+    forward_actions: List[Any] = [None]
+    forward_depths = [0]
+    forward_frontier = [(state, 0)]
+
+    backward_nodes: Dict[Any, int] = {}
+    backward_parents: List[int] = []
+    backward_keys: List[Any] = []
+    backward_depths: List[int] = []
+    backward_frontier = []
+    for goal in game.get_solved_states():
+        key = game.state_key(goal)
+        if key not in backward_nodes:
+            backward_nodes[key] = len(backward_keys)
+            backward_parents.append(-1)
+            backward_keys.append(key)
+            backward_depths.append(0)
+            backward_frontier.append((goal, backward_nodes[key]))
+    stats['goal_states'] = stats['visited_backward'] = len(backward_keys)
+    stats['peak_frontier'] = len(backward_frontier) + 1
+
+    # Pairs of forward and backward node numbers for the same State.
+    meetings: List[Tuple[int, int]] = []
+
+    while forward_frontier and backward_frontier and not meetings:
+        # Expand a whole layer of the search that has visited fewer States.
+        # Comparing frontier sizes instead would let the many solved States
+        # keep the backward search from ever starting on narrow puzzles.
+        # The layer must be finished after the searches first meet
+        # because a later State in it may give a shorter solution.
+        next_frontier = []
+        if len(forward_parents) <= len(backward_parents):
+            for current, node in forward_frontier:
+                stats['expanded_forward'] += 1
+                for action in game.get_possible_actions(current):
+                    new_state = game.take_action(
+                        current, action, validate=False)
+                    key = game.state_key(new_state)
+                    if key in forward_nodes:
+                        continue
+                    child = len(forward_parents)
+                    forward_nodes[key] = child
+                    forward_parents.append(node)
+                    forward_actions.append(action)
+                    forward_depths.append(forward_depths[node] + 1)
+                    if key in backward_nodes:
+                        meetings.append((child, backward_nodes[key]))
+                    next_frontier.append((new_state, child))
+            forward_frontier = next_frontier
+        else:
+            for current, node in backward_frontier:
+                stats['expanded_backward'] += 1
+                for action in game.get_possible_actions(current):
+                    new_state = game.take_action(
+                        current, action, validate=False)
+                    key = game.state_key(new_state)
+                    if key in backward_nodes:
+                        continue
+                    child = len(backward_parents)
+                    backward_nodes[key] = child
+                    backward_parents.append(node)
+                    backward_keys.append(key)
+                    backward_depths.append(backward_depths[node] + 1)
+                    if key in forward_nodes:
+                        meetings.append((forward_nodes[key], child))
+                    next_frontier.append((new_state, child))
+            backward_frontier = next_frontier
+        stats['peak_frontier'] = max(
+            stats['peak_frontier'],
+            len(forward_frontier) + len(backward_frontier))
+
+    stats['expanded'] = \
+        stats['expanded_forward'] + stats['expanded_backward']
+    stats['visited_forward'] = len(forward_parents)
+    stats['visited_backward'] = len(backward_parents)
+    if not meetings:
+        return None, stats
+
+    forward_node, backward_node = min(
+        meetings,
+        key=lambda m: forward_depths[m[0]] + backward_depths[m[1]])
+
+    # The first half of the solution comes from the forward parent pointers.
+    solution = _path(forward_parents, forward_actions, forward_node)
+    for action in solution:
+        state = game.take_action(state, action, validate=False)
+
+    # The backward search may have reached the meeting State with
+    # interchangeable pieces swapped, so its Actions cannot be reused.
+    # Instead, find the Action that leads to each State on its path.
+    node = backward_parents[backward_node]
+    while node != -1:
+        for action in game.get_possible_actions(state):
+            new_state = game.take_action(state, action, validate=False)
+            if game.state_key(new_state) == backward_keys[node]:
+                solution.append(action)
+                state = new_state
+                break
+        node = backward_parents[node]
+
+    return solution, stats
+
+
+def dfs(state: State, game: GameClass) -> Result:
+    """Solve a puzzle with given starting State using a depth-first search.
+    This stops at the first solution found, which is rarely the shortest."""
+    stats = {'expanded': 0, 'peak_frontier': 1}
+    visited_states = new_visited_states(game)
+
+    # Parent pointers are kept in two lists indexed by node number.
+    # The start node is number 0.
+    parents = [-1]
+    actions: List[Any] = [None]
+    stack = [(state, 0)]
+    while stack:
+        state, node = stack.pop()
+        if visited(game, state, visited_states):
+            continue
+
+        if game.is_solved(state):
+            return _path(parents, actions, node), stats
+
+        if DEBUG:
+            game.print_state(state)
+        stats['expanded'] += 1
+        children = []
+        for action in game.get_possible_actions(state):
+            parents.append(node)
+            actions.append(action)
+            new_state = game.take_action(state, action, validate=False)
+            children.append((new_state, len(parents) - 1))
+
+        # Push in reverse order so the first action is tried first.
+        children.reverse()
+        stack.extend(children)
+        stats['peak_frontier'] = max(stats['peak_frontier'], len(stack))
+
+    return None, stats
+
+
+def ida_star(state: State, game: GameClass) -> Result:
+    """Solve a puzzle with given starting State using an
+    iterative deepening A* search guided by the heuristic method of the game.
+    Each iteration is a depth-first search that gives up on States
+    whose estimated solution length exceeds a bound, so memory stays flat
+    apart from a table of at most IDA_TABLE_SIZE States
+    that keeps an iteration from exploring the same State twice.
+    This always finds a shortest solution."""
+    stats = {'expanded': 0, 'peak_frontier': 1, 'iterations': 0}
+
+    if game.is_solved(state):
+        return [], stats
+
+    bound = game.heuristic(state)
+    while True:
+        stats['iterations'] += 1
+        next_bound = math.inf
+        depths = {game.state_key(state): 0}
+        path: List[Action] = []
+
+        # Each entry holds a State on the current path
+        # and an iterator over the Actions not yet tried from it.
+        stack = [(state, iter(game.get_possible_actions(state)))]
+        stats['expanded'] += 1
+        while stack:
+            current, remaining = stack[-1]
+            action = next(remaining, None)
+            if action is None:
+                stack.pop()
+                if path:
+                    path.pop()
+                continue
+
+            new_state = game.take_action(current, action, validate=False)
+            depth = len(stack)
+            estimate = depth + game.heuristic(new_state)
+            if estimate > bound:
+                next_bound = min(next_bound, estimate)
+                continue
+
+            key = game.state_key(new_state)
+            if depths.get(key, math.inf) <= depth:
+                continue
+            if key in depths or len(depths) < IDA_TABLE_SIZE:
+                depths[key] = depth
+
+            path.append(action)
+            if game.is_solved(new_state):
+                return path, stats
+
+            stats['expanded'] += 1
+            new_actions = game.get_possible_actions(new_state)
+            stack.append((new_state, iter(new_actions)))
+            stats['peak_frontier'] = max(stats['peak_frontier'], len(stack))
+
+        if next_bound == math.inf:
+            return None, stats
+        bound = next_bound
+
+
+def new_visited_states(game: GameClass) -> VisitedStates:
+    """Create an empty collection of visited State keys of a game
+    as selected by COMPACT_VISITED."""
+    if COMPACT_VISITED and game.key_bits() < KEY_BITS:
+        return CompactSet(max_bytes=VISITED_MAX_BYTES)
+    return set()
+
+
+def next_action(state: State, game: GameClass) -> Optional[Action]:
+    """Get an Action that starts a shortest solution of a State
+    from the tablebase of the game, without searching.
+    Returns None if the State is solved or cannot be solved."""
+    import tablebase  # pylint: disable=C0415
+    return tablebase.open_tablebase(game, state).next_action(state)
+
 
+def optimize(
+        state: State,
+        actions: List[Action],
+        game: GameClass) -> List[Action]:
+    """Shorten a solution for a puzzle with given starting State
+    by cutting out loops and taking shortcuts between States on its path.
+    Each pass takes time proportional to the length of the solution.
+    Passes are repeated until the solution stops getting shorter."""
+    while True:
+        shorter = _shorten(state, actions, game)
+        if len(shorter) >= len(actions):
+            return actions
+        actions = shorter
 
-def visited(state: State) -> bool:
-    """Determine if a given State has already been visited."""
-    global visited_states
-    key = Game.state_string(state)
+
+def _shorten(
+        state: State, actions: List[Action], game: GameClass) -> List[Action]:
+    """Make one pass over a solution to shorten it. See optimize."""
+    # Replay the Actions, remembering the keys of the States on the path.
+    # Returning to a State already on the path closes a loop,
+    # so the States since its first visit are cut out.
+    start = state
+    keys = [game.state_key(state)]
+    indexes = {keys[0]: 0}
+    for action in actions:
+        state = game.take_action(state, action)
+        key = game.state_key(state)
+        index = indexes.get(key)
+        if index is not None:
+            for cut_key in keys[index + 1:]:
+                del indexes[cut_key]
+            del keys[index + 1:]
+        else:
+            indexes[key] = len(keys)
+            keys.append(key)
+
+    # Walk the path, jumping ahead whenever a small search
+    # from the current State finds a shorter way to a later one.
+    # Since States with interchangeable pieces swapped share a key,
+    # the current State may differ from the one first visited there,
+    # so the Actions that follow the path are found again.
+    shorter: List[Action] = []
+    state = start
+    index = 0
+    last = len(keys) - 1
+    while index < last:
+        index, shortcut = _shortcut(game, state, index, indexes, last)
+        if shortcut is None:
+            for action in game.get_possible_actions(state):
+                new_state = game.take_action(state, action, validate=False)
+                if game.state_key(new_state) == keys[index]:
+                    shortcut = [action]
+                    break
+            else:
+                # Equal keys should have the same moves, so this means
+                # state_key merges States that play differently.
+                raise ValueError(
+                    f'no Action reaches step {index} of the solution'
+                    ' from the State before it')
+        for action in shortcut:
+            state = game.take_action(state, action, validate=False)
+        shorter.extend(shortcut)
+    return shorter
+
+
+def _shortcut(
+        game: GameClass,
+        state: State,
+        index: int,
+        indexes: Dict[Any, int],
+        last: int) -> Tuple[int, Optional[List[Action]]]:
+    """Search breadth-first from the State at a given index of a path,
+    at most SHORTCUT_DEPTH Actions deep and SHORTCUT_STATES States wide,
+    for the State furthest along the path relative to the Actions
+    needed to reach it. Any solved State counts as the end of the path.
+    indexes maps the keys of the States on the path to their indexes.
+    Returns the index of the State found and the Actions that reach it,
+    or the next index and None if following the path is as good."""
+    best_target = index + 1
+    best_progress = 0  # path States skipped minus Actions taken
+    best_node = 0
+
+    # Parent pointers and depths are kept in lists indexed by node number.
+    # The start node is number 0.
+    parents = [-1]
+    actions: List[Any] = [None]
+    depths = [0]
+    seen = {game.state_key(state)}
+    frontier: Deque[Tuple[State, int]] = deque([(state, 0)])
+    while frontier and len(parents) < SHORTCUT_STATES:
+        state, node = frontier.popleft()
+        depth = depths[node] + 1
+        for action in game.get_possible_actions(state):
+            new_state = game.take_action(state, action, validate=False)
+            key = game.state_key(new_state)
+            if key in seen:
+                continue
+            seen.add(key)
+            parents.append(node)
+            actions.append(action)
+            depths.append(depth)
+            child = len(parents) - 1
+
+            target = last if game.is_solved(new_state) \
+                else indexes.get(key, -1)
+            progress = target - index - depth
+            if progress > best_progress:
+                best_target, best_progress, best_node = target, progress, child
+            if depth < SHORTCUT_DEPTH:
+                frontier.append((new_state, child))
+
+    if best_node == 0:
+        return best_target, None
+    return best_target, _path(parents, actions, best_node)
+
+
+def load_game(name: str) -> GameClass:
+    """Import the module of a game named by a key in GAMES
+    and return its class."""
+    module_name, class_name = GAMES[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def parse_numbers(spec: str) -> List[int]:
+    """Get the puzzle numbers in a comma-separated list
+    of numbers and ranges such as '1-5,8'.
+    Raises a ValueError if the list is not in that form."""
+    numbers: List[int] = []
+    for part in spec.split(','):
+        first, dash, last = part.partition('-')
+        if not first.isdigit() or dash and not last.isdigit() \
+                or dash and int(last) < int(first):
+            raise ValueError(
+                f"{spec!r} is not a list of numbers and ranges like '1-5,8'")
+        numbers.extend(range(int(first), int(last or first) + 1))
+    return numbers
+
+
+def report(
+        game: GameClass,
+        solution: Optional[List[Action]],
+        stats: Stats) -> None:
+    """Print a solution and the statistics of the search that found it."""
+    if solution is None:
+        print('No solution found.')
+    else:
+        game.print_actions('Solution:', solution)
+    print(', '.join(f'{name} = {value}' for name, value in stats.items()))
+
+
+def solve(state: State, game: GameClass) -> Result:
+    """Solve a puzzle with given starting State using a breadth-first search.
+    This always finds a shortest solution if there is one."""
+    stats = {'expanded': 0, 'peak_frontier': 1}
+    visited_states = new_visited_states(game)
+    visited(game, state, visited_states)
+
+    if game.is_solved(state):
+        return [], stats
+
+    # Parent pointers are kept in two lists indexed by node number.
+    # The start node is number 0.
+    parents = [-1]
+    actions: List[Any] = [None]
+    frontier: Deque[Tuple[State, int]] = deque([(state, 0)])
+    while frontier:
+        state, node = frontier.popleft()
+        if DEBUG:
+            game.print_state(state)
+        stats['expanded'] += 1
+        for action in game.get_possible_actions(state):
+            new_state = game.take_action(state, action, validate=False)
+            if visited(game, new_state, visited_states):
+                continue
+
+            parents.append(node)
+            actions.append(action)
+            child = len(parents) - 1
+            # Testing when a State is generated rather than when
+            # it is expanded is safe because every Action costs the same.
+            if game.is_solved(new_state):
+                return _path(parents, actions, child), stats
+            frontier.append((new_state, child))
+        stats['peak_frontier'] = max(stats['peak_frontier'], len(frontier))
+
+    return None, stats
+
+
+def solve_with_budget(
+        state: State,
+        game: GameClass,
+        engine: str,
+        max_nodes: Optional[int] = None,
+        max_seconds: Optional[float] = None) -> Result:
+    """Solve a puzzle with an engine named by a key in ENGINES,
+    giving up once it has expanded more than max_nodes nodes
+    or run for more than max_seconds seconds.
+    A search that gives up finds no solution and its statistics
+    hold the nodes expanded and budget_exceeded = 1."""
+    if max_nodes is None and max_seconds is None:
+        return ENGINES[engine](state, game)
+
+    # Each call of get_possible_actions counts as expanding a node.
+    expanded = 0
+    deadline = math.inf if max_seconds is None \
+        else time.perf_counter() + max_seconds
+    nodes = math.inf if max_nodes is None else max_nodes
+
+    class Budgeted(game):  # type: ignore
+        @staticmethod
+        def get_possible_actions(state: State) -> List[Action]:
+            nonlocal expanded
+            expanded += 1
+            if expanded > nodes or time.perf_counter() > deadline:
+                raise BudgetExceeded()
+            return game.get_possible_actions(state)
+
+    Budgeted.__name__ = game.__name__
+    try:
+        return ENGINES[engine](state, Budgeted)
+    except BudgetExceeded:
+        return None, {'expanded': expanded - 1, 'budget_exceeded': 1}
+
+
+def _tablebase(state: State, game: GameClass) -> Result:
+    """Solve a puzzle by following decreasing distances in its tablebase.
+    The tablebase module is only imported when it is used
+    because building its tables takes a noticeable time."""
+    import tablebase  # pylint: disable=C0415
+    return tablebase.solve(state, game)
+
+
+def visited(
+        game: GameClass, state: State, visited_states: VisitedStates) -> bool:
+    """Determine if a given State has already been visited
+    and record that it has been.
+    visited_states may be a set or a CompactSet, which needs int keys."""
+    key = game.state_key(state)
     seen = key in visited_states
     if not seen:
         visited_states.add(key)
-        #print('solver.py visited: key =', key)
     return seen
 
 
-puzzles = Game.load_puzzles()
+ENGINES: Dict[str, Callable[[State, GameClass], Result]] = {
+    'astar': a_star,
+    'bfs': solve,
+    'bidirectional': bidirectional,
+    'dfs': dfs,
+    'idastar': ida_star,
+    'tablebase': _tablebase
+}
+
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Solve Lunar Lockout, Moving Pieces and Tilt puzzles.')
+    parser.add_argument(
+        '--game', choices=sorted(GAMES), default=GAME,
+        help=f'game to solve (default {GAME})')
+    parser.add_argument(
+        '--input', metavar='PATH',
+        help="puzzle file to read one row at a time, or '-' to read"
+             " standard input (default the game's own puzzle file);"
+             f' files ending with {CORPUS_SUFFIX} are corpus files')
+    parser.add_argument(
+        '--puzzles', metavar='LIST',
+        help="puzzle numbers and ranges to solve, such as '1-5,8'"
+             ' (default all)')
+    parser.add_argument(
+        '--engine', choices=sorted(ENGINES), default=ENGINE,
+        help=f'search engine (default {ENGINE})')
+    parser.add_argument(
+        '--workers', type=int, default=WORKERS,
+        help=f'processes solving puzzles at the same time (default {WORKERS})')
+    parser.add_argument(
+        '--max-nodes', type=int, metavar='N',
+        help='give up on a puzzle after expanding N nodes')
+    parser.add_argument(
+        '--max-seconds', type=float, metavar='S',
+        help='give up on a puzzle after S seconds')
+    parser.add_argument(
+        '--format', choices=['text', 'jsonl'], default='text',
+        help='print boards and solutions as text (the default)'
+             ' or one JSON object per line for each puzzle')
+    parser.add_argument(
+        '--cache', metavar='PATH', default=CACHE_FILE,
+        help=f'file storing solutions between runs (default {CACHE_FILE})')
+    parser.add_argument(
+        '--no-cache', dest='cache', action='store_const', const=None,
+        help='do not store solutions')
+    parser.add_argument(
+        '--force', action='store_true', default=FORCE_SOLVE,
+        help='solve puzzles again even when solutions are stored')
+    parser.add_argument(
+        '--instrument', action='store_true', default=INSTRUMENT,
+        help='report the calls and time of each game method'
+             ' and the nodes expanded at each depth')
+    parser.add_argument(
+        '--profile', metavar='PATH', default=PROFILE_FILE,
+        help='with --instrument, save cProfile statistics to PATH')
+    args = parser.parse_args(argv)
+
+    try:
+        args.wanted = None if args.puzzles is None \
+            else set(parse_numbers(args.puzzles))
+    except ValueError as error:
+        parser.error(f'--puzzles: {error}')
+    if args.input not in (None, '-') and not os.path.isfile(args.input):
+        parser.error(f'--input: there is no file {args.input}')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    for option, value in (('--max-nodes', args.max_nodes),
+                          ('--max-seconds', args.max_seconds)):
+        if value is not None and value <= 0:
+            parser.error(f'{option} must be more than 0')
+    if args.instrument and args.workers > 1:
+        parser.error('--instrument solves puzzles in this process'
+                     ' and cannot be used with --workers')
+    game = load_game(args.game)
+    if args.engine == 'bidirectional' \
+            and not hasattr(game, 'get_solved_states'):
+        parser.error(f'the bidirectional engine does not support {args.game}')
+    if args.engine == 'tablebase':
+        _check_tablebases(parser, args, game)
+    return args
+
+
+def _check_tablebases(
+        parser: argparse.ArgumentParser,
+        args: argparse.Namespace,
+        game: GameClass) -> None:
+    """Report an error if a game has no tablebase or if the tablebase files
+    the selected puzzles need have not been built.
+    Puzzles from standard input cannot be read twice, so only the game
+    is checked for them."""
+    import tablebase  # pylint: disable=C0415
+    if not issubclass(game, (tablebase.LunarLockout, tablebase.MovingPieces)):
+        parser.error(f'the tablebase engine does not support {args.game}')
+    if args.input == '-':
+        return
+    paths = {tablebase.tablebase_path(game, state)
+             for i, state in _read_puzzles(game, args.input)
+             if args.wanted is None or i in args.wanted}
+    missing = sorted(path for path in paths if not os.path.exists(path))
+    if missing:
+        parser.error('tablebase files not built: ' + ', '.join(missing)
+                     + '; see tablebase.py')
+
+
+def _read_puzzles(
+        game: GameClass, path: Optional[str]) -> Iterator[Tuple[int, State]]:
+    """Yield the number and State of each puzzle in a puzzle file,
+    a corpus file or, if path is None, the game's own puzzle file."""
+    if path is None:
+        return game.iter_puzzles()
+    if path.endswith(CORPUS_SUFFIX):
+        from corpus import open_corpus  # pylint: disable=C0415
+        return iter(open_corpus(path, game))
+    return game.iter_puzzles(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    game = load_game(args.game)
 
-visited_states: Set[str] = set()
+    # Puzzles are read, solved and printed one at a time
+    # so memory use does not grow with the number of puzzles.
+    wanted = args.wanted
+    corpus = None
+    puzzles: Iterator[Tuple[int, State]]
+    if args.input is not None and args.input.endswith(CORPUS_SUFFIX):
+        from corpus import open_corpus  # pylint: disable=C0415
+        corpus = open_corpus(args.input, game)
+        indexes: Iterable[int] = range(len(corpus))
+        if wanted is not None:
+            indexes = (index for index in indexes
+                       if corpus.number(index) in wanted)
+        puzzles = map(corpus.__getitem__, indexes)
+    else:
+        puzzles = _read_puzzles(game, args.input)
+    if wanted is not None and corpus is None:
+        puzzles = ((i, state) for i, state in puzzles if i in wanted)
+
+    def budgeted(state: State, game: GameClass) -> Result:
+        return solve_with_budget(
+            state, game, args.engine, args.max_nodes, args.max_seconds)
+
+    budgeted.__name__ = ENGINES[args.engine].__name__
+
+    # pylint: disable=C0415
+    cache = None
+    if args.cache:
+        from cache import SolutionCache
+        cache = SolutionCache(args.cache)
+
+    def stored(state: State) -> Optional[Result]:
+        if cache is None or args.force:
+            return None
+        return cache.get(game, args.engine, state)
+
+    instrumentation = None
+    if args.instrument:
+        from instrument import Instrumentation
+        instrumentation = Instrumentation(
+            game, sys.modules[__name__], args.profile)
+
+    results: Iterator[Tuple[int, State, Result]]
+    if args.workers > 1 and corpus:
+        # Workers read the puzzles from the corpus file themselves.
+        from parallel import solve_corpus
+        results = solve_corpus(
+            game, args.input, indexes, args.engine, args.workers,
+            args.max_nodes, args.max_seconds, stored)
+    elif args.workers > 1:
+        from parallel import solve_stream
+        results = solve_stream(
+            game, puzzles, args.engine, args.workers,
+            args.max_nodes, args.max_seconds, stored)
+    else:
+        def search(state: State) -> Result:
+            if instrumentation:
+                return instrumentation.run(budgeted, state)
+            return budgeted(state, game)
+
+        results = ((i, state, stored(state) or search(state))
+                   for i, state in puzzles)
+
+    all_solved = True
+    found = set()
+    with instrumentation or contextlib.nullcontext():
+        for i, state, (solution, stats) in results:
+            if wanted is not None:
+                found.add(i)
+            if 'cached' not in stats:
+                if solution is not None and args.engine == 'dfs':
+                    solution = optimize(state, solution, game)
+                if cache and not stats.get('budget_exceeded'):
+                    cache.put(game, args.engine, state, (solution, stats))
+            all_solved = all_solved and solution is not None
+
+            if args.format == 'jsonl':
+                print(json.dumps({
+                    'game': args.game,
+                    'puzzle': i,
+                    'engine': args.engine,
+                    'moves': None if solution is None else len(solution),
+                    'solution': solution,
+                    'stats': stats
+                }), flush=True)
+            else:
+                print('\nPuzzle #' + str(i))
+                game.print_state(state)
+                report(game, solution, stats)
+
+    if cache:
+        cache.close()
+    if instrumentation:
+        print()
+        instrumentation.report()
+    missing = sorted(wanted - found) if wanted else []
+    for i in missing:
+        print(f'There is no {args.game} puzzle #{i}.', file=sys.stderr)
+    if missing or not all_solved:
+        sys.exit(1)
 
-for i in range(1, len(puzzles) + 1):
-    state = puzzles[i]
-    print('\nPuzzle #' + str(i))
-    Game.initialize()
-    Game.print_state(state)
-    solution = None
-    visited_states.clear()
-    solve(state, [])
-    report()
 
-# Solve a single puzzle instead of all.
-# state = puzzles[8]
-# Game.print_state(state)
-# solve(state, [])
-# report()
+if __name__ == '__main__':
+    main()
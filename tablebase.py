@@ -0,0 +1,413 @@
+"""Builds and reads tablebases holding the number of Actions needed
+to solve every State of a game that can be solved, found by searching
+backward from the solved States.
+Enter `python tablebase.py lunar_lockout 4` to build the Lunar Lockout
+tablebase for puzzles with 4 helper robots
+or `python tablebase.py moving_pieces` to build the Moving Pieces one
+for the current board size."""
+import itertools
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+import lunar_lockout
+from lunar_lockout import LunarLockout
+from moving_pieces import MovingPieces
+from share import direction_deltas, directions
+
+# A file starts with a header holding MAGIC, the name of its game,
+# FORMAT_VERSION, the RULES_VERSION of the game, the number of entries,
+# a parameter of the game, such as the number of helper robots,
+# and the number of columns and rows of the board.
+# It is padded so the keys that may follow are aligned.
+MAGIC = b'PZTB'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<4s16sIIIIII4x')
+
+# Distance stored for States that cannot be solved.
+UNSOLVABLE = 255
+
+# Directory holding the tablebase files.
+TABLEBASE_DIR = '.'
+
+LL_CELLS = lunar_lockout.SIZE * lunar_lockout.SIZE
+
+# Lunar Lockout tablebases are only built for the board size
+# the module was loaded with, which the tables below are made for.
+# The helper robots in a Lunar Lockout State are interchangeable
+# when counting Actions, so an entry describes the cell of the red robot
+# and the set of cells holding helpers.
+# Entries are numbered by red cell and then by the rank of the set
+# among all sets of that many of the other cells in colexicographic order.
+# Ranks are found with two tables indexed by the low and high halves
+# of a mask of those cells.
+LL_HALF_BITS = (LL_CELLS - 1) // 2
+LL_HALF_MASK = (1 << LL_HALF_BITS) - 1
+
+
+def _make_ranks() -> Tuple[List[int], List[List[int]]]:
+    """Build the tables used by _ll_entry."""
+    low = [_colex_rank(mask, 0) for mask in range(LL_HALF_MASK + 1)]
+    high = [[_colex_rank(mask << LL_HALF_BITS, count)
+             for mask in range(1 << (LL_CELLS - 1 - LL_HALF_BITS))]
+            for count in range(LL_HALF_BITS + 1)]
+    return low, high
+
+
+def _colex_rank(mask: int, before: int) -> int:
+    """Get the contribution of the cells in a mask to the rank of a set
+    that has before cells lower than any of them."""
+    rank = 0
+    position = before
+    for cell in range(LL_CELLS - 1):
+        if mask >> cell & 1:
+            position += 1
+            rank += math.comb(cell, position)
+    return rank
+
+
+def _check_lunar_lockout_size() -> None:
+    """Raise a ValueError if the Lunar Lockout board size has changed
+    since the tables for Lunar Lockout tablebases were built."""
+    if lunar_lockout.SIZE * lunar_lockout.SIZE != LL_CELLS:
+        raise ValueError('Lunar Lockout tablebases are only built for'
+                         f' {LL_CELLS} cells')
+
+
+def _file_name(game: Any, parameter: int) -> str:
+    """Get the name of the tablebase file of a game
+    with a given parameter and the current board size."""
+    if issubclass(game, LunarLockout):
+        return f'lunar_lockout_{parameter}.tb'
+    columns, rows = game.board_size()
+    return f'moving_pieces_{columns}x{rows}.tb'
+
+
+def _ll_entry(red: int, helpers: int, count: int) -> int:
+    """Get the entry number of a Lunar Lockout position
+    given the cell of the red robot and a mask of the helper cells."""
+    # Remove the bit of the red cell so the helpers use LL_CELLS - 1 bits.
+    helpers = helpers & ((1 << red) - 1) | helpers >> (red + 1) << red
+    low = helpers & LL_HALF_MASK
+    rank = _low_ranks[low] + _high_ranks[low.bit_count()][
+        helpers >> LL_HALF_BITS]
+    return red * math.comb(LL_CELLS - 1, count) + rank
+
+
+def ll_entry_state(entry: int, count: int) -> lunar_lockout.State:
+    """Get a Lunar Lockout State of the position with an entry number
+    in the tablebase for count helper robots.
+    The helpers are given to the first robots after red
+    in the order of their cells."""
+    red, rank = divmod(entry, math.comb(LL_CELLS - 1, count))
+    cells = []
+    for position in range(count, 0, -1):
+        cell = LL_CELLS - 2
+        while math.comb(cell, position) > rank:
+            cell -= 1
+        rank -= math.comb(cell, position)
+        # Cells after the red one were numbered without it.
+        cells.append(cell + 1 if cell >= red else cell)
+    cells.reverse()
+    cells += [lunar_lockout.ABSENT] * (
+        len(lunar_lockout.robot_ids) - 1 - count)
+    state = red
+    for index, cell in enumerate(cells, 1):
+        state |= cell << (index * lunar_lockout.CELL_BITS)
+    return state
+
+
+def _ll_position(state: lunar_lockout.State) -> Tuple[int, int, int]:
+    """Get the cell of the red robot, a mask of the helper cells
+    and the number of helpers in a Lunar Lockout State."""
+    red = state & lunar_lockout.CELL_MASK
+    helpers = count = 0
+    for _ in range(len(lunar_lockout.robot_ids) - 1):
+        state >>= lunar_lockout.CELL_BITS
+        cell = state & lunar_lockout.CELL_MASK
+        if cell != lunar_lockout.ABSENT:
+            helpers |= 1 << cell
+            count += 1
+    return red, helpers, count
+
+
+def _make_rays() -> List[List[Tuple[Optional[int], List[int]]]]:
+    """Build, for each cell and direction, the cell a blocker must occupy
+    for a robot moving that way to stop in the cell (or None)
+    and the cells the robot may have started from, nearest first."""
+    size = lunar_lockout.SIZE
+    rays = []
+    for cell in range(LL_CELLS):
+        row, column = divmod(cell, size)
+        cell_rays = []
+        for direction in directions:
+            dx, dy = direction_deltas[direction]
+            blocker = None
+            if 0 <= column + dx < size and 0 <= row + dy < size:
+                blocker = (row + dy) * size + column + dx
+            starts = []
+            c, r = column - dx, row - dy
+            while 0 <= c < size and 0 <= r < size:
+                starts.append(r * size + c)
+                c, r = c - dx, r - dy
+            cell_rays.append((blocker, starts))
+        rays.append(cell_rays)
+    return rays
+
+
+def build_lunar_lockout(count: int) -> bytearray:
+    """Find the distance of every Lunar Lockout position
+    with count helper robots, indexed by entry number."""
+    _check_lunar_lockout_size()
+    distances = bytearray([UNSOLVABLE]) * (
+        LL_CELLS * math.comb(LL_CELLS - 1, count))
+
+    # Positions are packed into ints holding the red cell
+    # in the lowest CELL_BITS bits and the mask of helper cells above.
+    shift = lunar_lockout.CELL_BITS
+    red = lunar_lockout.CENTER_CELL
+    others = [cell for cell in range(LL_CELLS) if cell != red]
+    frontier = []
+    for cells in itertools.combinations(others, count):
+        helpers = sum(1 << cell for cell in cells)
+        distances[_ll_entry(red, helpers, count)] = 0
+        frontier.append(red | helpers << shift)
+
+    distance = 0
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for position in frontier:
+            red = position & lunar_lockout.CELL_MASK
+            helpers = position >> shift
+            occupied = helpers | 1 << red
+            robots = occupied
+            while robots:
+                bit = robots & -robots
+                robots ^= bit
+                cell = bit.bit_length() - 1
+                # A robot in this cell may have slid here from any empty cell
+                # behind it in a direction if a blocker is ahead of it.
+                for blocker, starts in _rays[cell]:
+                    if blocker is None or not occupied >> blocker & 1:
+                        continue
+                    for start in starts:
+                        if occupied >> start & 1:
+                            break
+                        if cell == red:
+                            previous = start | helpers << shift
+                            entry = _ll_entry(start, helpers, count)
+                        else:
+                            moved = helpers ^ bit ^ 1 << start
+                            previous = red | moved << shift
+                            entry = _ll_entry(red, moved, count)
+                        if distances[entry] == UNSOLVABLE:
+                            distances[entry] = distance
+                            next_frontier.append(previous)
+        frontier = next_frontier
+    return distances
+
+
+def build_moving_pieces() -> Tuple[List[int], bytearray]:
+    """Find the distance of every Moving Pieces State
+    from which the puzzle can be solved.
+    Returns the sorted State keys and their distances.
+    Every move can be undone, so searching forward from the solved States
+    finds the same distances as searching backward."""
+    distances: Dict[int, int] = {}
+    frontier = []
+    for state in MovingPieces.get_solved_states():
+        key = MovingPieces.state_key(state)
+        if key not in distances:
+            distances[key] = 0
+            frontier.append(state)
+
+    distance = 0
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for state in frontier:
+            for action in MovingPieces.get_possible_actions(state):
+                new_state = MovingPieces.take_action(
+                    state, action, validate=False)
+                key = MovingPieces.state_key(new_state)
+                if key not in distances:
+                    distances[key] = distance
+                    next_frontier.append(new_state)
+        frontier = next_frontier
+
+    keys = sorted(distances)
+    if keys[-1] >> 64:
+        raise ValueError('the State keys of this board do not fit in 64 bits')
+    return keys, bytearray(distances[key] for key in keys)
+
+
+def tablebase_path(game: Any, state: Any) -> str:
+    """Get the path of the tablebase file that covers a State of a game."""
+    if issubclass(game, LunarLockout):
+        _check_lunar_lockout_size()
+        count = _ll_position(state)[2]
+        return os.path.join(TABLEBASE_DIR, _file_name(game, count))
+    if issubclass(game, MovingPieces):
+        return os.path.join(TABLEBASE_DIR, _file_name(game, 0))
+    raise ValueError(game.__name__ + ' has no tablebase')
+
+
+def write_tablebase(
+        path: str,
+        game: Any,
+        parameter: int,
+        distances: bytearray,
+        keys: Optional[List[int]] = None) -> None:
+    """Write a tablebase file holding the distance of each entry
+    and, for games whose entries are not numbered, their sorted keys."""
+    name = game.__name__.encode()
+    columns, rows = game.board_size()
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, name, FORMAT_VERSION,
+                               game.RULES_VERSION, len(distances), parameter,
+                               columns, rows))
+        if keys is not None:
+            file.write(struct.pack(f'<{len(keys)}Q', *keys))
+        file.write(distances)
+
+
+class Tablebase:
+    """A memory-mapped tablebase file written by write_tablebase."""
+
+    def __init__(self, path: str, game: Any):
+        with open(path, 'rb') as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, name, version, rules_version, entries, self.parameter, \
+            columns, rows = HEADER.unpack_from(self.mapping)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(path + ' is not a tablebase file')
+        if name.rstrip(b'\0').decode() != game.__name__ \
+                or rules_version != game.RULES_VERSION \
+                or (columns, rows) != game.board_size():
+            raise ValueError(path + ' was built for other game rules')
+
+        self.game = game
+        view = memoryview(self.mapping)
+        start = HEADER.size
+        self.keys: Optional[memoryview] = None
+        if issubclass(game, MovingPieces):
+            end = start + 8 * entries
+            self.keys = view[start:end].cast('Q')
+            start = end
+        self.distances = view[start:start + entries]
+
+    def close(self) -> None:
+        if self.keys is not None:
+            self.keys.release()
+        self.distances.release()
+        self.mapping.close()
+
+    def distance(self, state: Any) -> Optional[int]:
+        """Get the number of Actions needed to solve a State,
+        or None if it cannot be solved."""
+        if self.keys is None:
+            red, helpers, count = _ll_position(state)
+            if count != self.parameter:
+                raise ValueError(
+                    f'the tablebase is for {self.parameter} helper robots')
+            distance = self.distances[_ll_entry(red, helpers, count)]
+        else:
+            key = self.game.state_key(state)
+            index = bisect_left(self.keys, key)
+            if index == len(self.keys) or self.keys[index] != key:
+                return None
+            distance = self.distances[index]
+        return None if distance == UNSOLVABLE else distance
+
+    def next_action(self, state: Any) -> Optional[Any]:
+        """Get an Action that starts a shortest solution of a State,
+        or None if it is solved or cannot be solved."""
+        distance = self.distance(state)
+        if not distance:
+            return None
+        for action in self.game.get_possible_actions(state):
+            new_state = self.game.take_action(state, action, validate=False)
+            if self.distance(new_state) == distance - 1:
+                return action
+        raise ValueError('the tablebase does not match the game rules')
+
+
+# Tablebases opened by open_tablebase, by path.
+_open_tablebases: Dict[str, Tablebase] = {}
+
+
+def open_tablebase(game: Any, state: Any) -> Tablebase:
+    """Get the Tablebase that covers a State of a game,
+    opening its file the first time it is needed."""
+    path = tablebase_path(game, state)
+    tablebase = _open_tablebases.get(path)
+    if tablebase is None:
+        if not os.path.exists(path):
+            raise ValueError(path + ' has not been built; see tablebase.py')
+        tablebase = _open_tablebases[path] = Tablebase(path, game)
+    return tablebase
+
+
+def solve(
+        state: Any, game: Any) -> Tuple[Optional[List[Any]], Dict[str, int]]:
+    """Solve a puzzle with given starting State by following
+    decreasing distances in its tablebase, without searching.
+    This always finds a shortest solution."""
+    tablebase = open_tablebase(game, state)
+    stats = {'expanded': 0, 'peak_frontier': 1}
+    if tablebase.distance(state) is None:
+        return None, stats
+
+    solution: List[Any] = []
+    while True:
+        action = tablebase.next_action(state)
+        if action is None:
+            return solution, stats
+        stats['expanded'] += 1
+        solution.append(action)
+        state = game.take_action(state, action, validate=False)
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in ('lunar_lockout',
+                                                'moving_pieces'):
+        print('usage: python tablebase.py lunar_lockout helpers'
+              ' | moving_pieces')
+        sys.exit(1)
+
+    start = time.perf_counter()
+    game: Any
+    if sys.argv[1] == 'lunar_lockout':
+        count = int(sys.argv[2])
+        game = LunarLockout
+        parameter = count
+        keys = None
+        distances = build_lunar_lockout(count)
+    else:
+        game = MovingPieces
+        parameter = 0
+        keys, distances = build_moving_pieces()
+    elapsed = time.perf_counter() - start
+    path = os.path.join(TABLEBASE_DIR, _file_name(game, parameter))
+    write_tablebase(path, game, parameter, distances, keys)
+
+    solvable = len(distances) - distances.count(UNSOLVABLE)
+    longest = max(set(distances) - {UNSOLVABLE}, default=0)
+    print(f'{path}: {len(distances):,} entries, {solvable:,} solvable,'
+          f' longest solution {longest}')
+    print(f'built in {elapsed:.1f} seconds,'
+          f' {os.path.getsize(path):,} bytes')
+
+
+# These are built once so entry numbers and moves are found by lookups.
+_low_ranks, _high_ranks = _make_ranks()
+_rays = _make_rays()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
-import csv
+import functools
 import math
-from typing import Dict, List, Optional, Tuple
-from share import direction_map, directions
+from typing import Dict, Iterator, List, Tuple
+from share import (
+    coordinate_width, direction_map, directions, parse_positions,
+    position_string, read_rows)
 
 Action = str  # direction letter
 # The outer list holds rows described by inner lists.
@@ -9,31 +11,213 @@ Action = str  # direction letter
 Board = List[List[str]]
 Position = List[int]  # column and row one-based indexes
 Piece = Tuple[str, Position]
-State = Board
+
+# A State packs a Board into CELL_BITS bits per cell, row by row,
+# starting with the upper-left cell in the lowest bits.
+# The hole is always in the center, so it isn't stored.
+# Being an int, a State is its own key in a set of visited States.
+State = int
 
 DEBUG = False
+
+# The board has SIZE rows and SIZE columns with the hole in the center.
+# Call set_size to change it and the values and tables derived from it.
+# The tilt tables have 4 ** SIZE entries per row,
+# so they take a few seconds to build for sizes over 8.
 SIZE = 5
 CENTER = math.floor(SIZE / 2)
 TARGET = 'O'
 
+CELL_BITS = 2
+CELL_MASK = (1 << CELL_BITS) - 1
+LANE_BITS = CELL_BITS * SIZE
+LANE_MASK = (1 << LANE_BITS) - 1
+
+# Most States whose successors are remembered.
+SUCCESSOR_CACHE_SIZE = 1 << 16
+
+# Codes of the pieces in a State, indexed by their value.
+pieces = (' ', 'G', 'B', 'X')
+
+# Mask with the low bit of every cell set, which only green pieces have
+# without the high bit.
+LOW_BITS = sum(1 << (cell * CELL_BITS) for cell in range(SIZE * SIZE))
+
+# Mask of the low bits of the cells in the center row and column.
+CENTER_LINES = sum(
+    1 << ((row * SIZE + column) * CELL_BITS)
+    for row in range(SIZE) for column in range(SIZE)
+    if CENTER in (row, column))
+
 #directions = cast(List[Action], direction_map.keys())
 
 
-def _place_pieces(board: State, name: str, coords: str) -> List[Position]:
-    """Set the positions for a single kind of piece."""
-    i = 0
-    length = len(coords)
-    positions: List[Position] = []
-    while i < length:
-        column = int(coords[i])
-        row = int(coords[i + 1])
+def _greens(board: State) -> int:
+    """Get a mask with the low bit set of every cell holding a green piece."""
+    return board & ~(board >> 1) & LOW_BITS
+
+
+def _make_spread() -> List[int]:
+    """Build a list indexed by the bits of one row of a State giving
+    the same cells spread out to one per row, for transposing a State."""
+    spread = []
+    for lane in range(LANE_MASK + 1):
+        value = 0
+        for column in range(SIZE):
+            piece = (lane >> (column * CELL_BITS)) & CELL_MASK
+            value |= piece << (column * LANE_BITS)
+        spread.append(value)
+    return spread
+
+
+def _make_tilt_tables() -> Dict[Action, List[List[int]]]:
+    """Build, for each direction and each row or column index,
+    a list indexed by the bits of that row or column giving its bits
+    after the tilt, or -1 if the tilt would drop a blue piece in the hole.
+    Only the center row or column has the hole,
+    so every other index shares the same list."""
+    tables = {}
+    for direction in directions:
+        outer = _make_tilt_table(direction, False)
+        center = _make_tilt_table(direction, True)
+        tables[direction] = [center if index == CENTER else outer
+                             for index in range(SIZE)]
+    return tables
+
+
+def _make_tilt_table(direction: Action, has_hole: bool) -> List[int]:
+    """Build the list described in _make_tilt_tables for one direction
+    and a row or column with or without the hole."""
+    forward = direction in ('R', 'D')
+    table = []
+    for lane in range(LANE_MASK + 1):
+        vector = [pieces[(lane >> (i * CELL_BITS)) & CELL_MASK]
+                  for i in range(SIZE)]
+        if has_hole:
+            vector[CENTER] = TARGET
+        if forward:
+            vector.reverse()
+        if not Tilt._process_vector(vector):
+            table.append(-1)
+            continue
+        if forward:
+            vector.reverse()
+        new_lane = 0
+        for i, piece in enumerate(vector):
+            if piece != TARGET:
+                new_lane |= pieces.index(piece) << (i * CELL_BITS)
+        table.append(new_lane)
+    return table
+
+
+def _place_pieces(board: Board, name: str, coords: str) -> None:
+    """Set the positions for a single kind of piece.
+    Each coordinate has as many digits as SIZE."""
+    for column, row in parse_positions(coords, coordinate_width(SIZE)):
         board[row - 1][column - 1] = name
-        i += 2
-    return positions
+
+
+@functools.lru_cache(maxsize=SUCCESSOR_CACHE_SIZE)
+def _successors(board: State) -> Tuple[Tuple[Action, State], ...]:
+    """Get the tilts that change a State paired with the States they produce.
+    Tilting the same way twice in a row never changes a State,
+    so this also rules out repeating the last tilt.
+    The result only depends on the State, so it is cached."""
+    successors = []
+    for direction in directions:
+        new_board = _tilt(board, direction)
+        if new_board != board:
+            successors.append((direction, new_board))
+    return tuple(successors)
+
+
+def _tilt(board: State, direction: Action) -> State:
+    """Tilt a State in a direction and return the new State,
+    which is the same State if a blue piece would fall in the hole."""
+    # Tilts are done on rows, so columns become rows and back
+    # for vertical tilts.
+    if direction in ('L', 'R'):
+        new_board = _tilt_lanes(board, _tilt_tables[direction])
+    else:
+        new_board = _tilt_lanes(_transpose(board), _tilt_tables[direction])
+        if new_board >= 0:
+            new_board = _transpose(new_board)
+    return board if new_board < 0 else new_board
+
+
+def _tilt_lanes(board: State, tables: List[List[int]]) -> State:
+    """Tilt each row of a State toward its first cell using
+    a table for each row, returning -1 if a blue piece would fall."""
+    new_board = 0
+    shift = 0
+    for table in tables:
+        new_lane = table[(board >> shift) & LANE_MASK]
+        if new_lane < 0:
+            return -1
+        new_board |= new_lane << shift
+        shift += LANE_BITS
+    return new_board
+
+
+def _transpose(board: State) -> State:
+    """Swap the rows and columns of a State."""
+    transposed = 0
+    for row in range(SIZE):
+        lane = (board >> (row * LANE_BITS)) & LANE_MASK
+        transposed |= _spread[lane] << (row * CELL_BITS)
+    return transposed
+
+
+def pack_board(board: Board) -> State:
+    """Create a State from a Board."""
+    state = 0
+    for row in range(SIZE):
+        for column in range(SIZE):
+            piece = board[row][column]
+            if piece != TARGET:
+                cell = row * SIZE + column
+                state |= pieces.index(piece) << (cell * CELL_BITS)
+    return state
+
+
+def set_size(size: int) -> None:
+    """Change the number of rows and columns of the board and rebuild
+    the values and tables derived from it.
+    States made for the previous size are not valid afterward."""
+    # pylint: disable=W0603
+    global SIZE, CENTER, LANE_BITS, LANE_MASK, LOW_BITS, CENTER_LINES
+    global _spread, _tilt_tables
+    if size < 3:
+        raise ValueError('the board must have at least 3 rows and columns')
+    SIZE = size
+    CENTER = math.floor(SIZE / 2)
+    LANE_BITS = CELL_BITS * SIZE
+    LANE_MASK = (1 << LANE_BITS) - 1
+    LOW_BITS = sum(1 << (cell * CELL_BITS) for cell in range(SIZE * SIZE))
+    CENTER_LINES = sum(
+        1 << ((row * SIZE + column) * CELL_BITS)
+        for row in range(SIZE) for column in range(SIZE)
+        if CENTER in (row, column))
+    _successors.cache_clear()
+    _spread = _make_spread()
+    _tilt_tables = _make_tilt_tables()
+
+
+def unpack_board(state: State) -> Board:
+    """Create a Board from a State."""
+    board = []
+    for _ in range(SIZE):
+        board.append([pieces[(state >> (i * CELL_BITS)) & CELL_MASK]
+                      for i in range(SIZE)])
+        state >>= LANE_BITS
+    board[CENTER][CENTER] = TARGET
+    return board
 
 
 class Tilt:
-    last_direction: Optional[Action] = None
+    # Change this when the rules or the State encoding change
+    # so stored solutions are not reused.
+    RULES_VERSION = 2
 
     @staticmethod
     def action_string(action: Action) -> str:
@@ -41,42 +225,64 @@ class Tilt:
         return 'tilt ' + direction_map[action]
 
     @staticmethod
-    def get_possible_actions(_: State) -> List[Action]:
-        """Get all the possible actions that can be taken in a given State."""
-        return list(filter(lambda d: d != Tilt.last_direction, directions))
+    def board_size() -> Tuple[int, int]:
+        """Get the number of columns and rows of the board."""
+        return SIZE, SIZE
+
+    @staticmethod
+    def get_possible_actions(board: State) -> List[Action]:
+        """Get all the possible actions that can be taken in a given State.
+        Tilts that would change nothing are left out."""
+        return [direction for direction, _ in _successors(board)]
+
+    @staticmethod
+    def heuristic(board: State) -> int:
+        """Estimate the number of Actions needed to solve a State
+        without overestimating it."""
+        # Any number of green pieces can drop into the hole in one tilt,
+        # but only pieces in the center row or column can reach it.
+        greens = _greens(board)
+        if not greens:
+            return 0
+        return 1 if greens & CENTER_LINES == greens else 2
 
     @staticmethod
     def initialize() -> None:
-        Tilt.last_direction = None
+        """Forget the successors remembered for earlier puzzles,
+        so each puzzle is solved with an empty cache."""
+        _successors.cache_clear()
 
     @staticmethod
     def is_solved(board: State) -> bool:
         """Determine if a State represents a solved puzzle."""
         # Are there no green pieces left?
-        for row in range(SIZE):
-            if 'G' in board[row]:
-                return False
-        return True
+        return not _greens(board)
 
     @staticmethod
-    def load_puzzles() -> Dict[int, State]:
+    def iter_puzzles(path: str = 'tilt.csv') -> Iterator[Tuple[int, State]]:
+        """Yield the number and State of each puzzle in a file,
+        reading one row at a time; a path of '-' reads standard input."""
+        for number, blockers, greens, blues in read_rows(path):
+            # Build a SIZE x SIZE array of pieces.
+            board = []
+            for _ in range(SIZE):
+                board.append([' '] * SIZE)
+            board[CENTER][CENTER] = TARGET
+            _place_pieces(board, 'X', blockers)
+            _place_pieces(board, 'G', greens)
+            _place_pieces(board, 'B', blues)
+            yield int(number), pack_board(board)
+
+    @staticmethod
+    def key_bits() -> int:
+        """Get the most bits in the state_key of a State
+        on the current board."""
+        return SIZE * SIZE * CELL_BITS
+
+    @staticmethod
+    def load_puzzles(path: str = 'tilt.csv') -> Dict[int, State]:
         """Load a set of puzzles from a file."""
-        puzzles = {}
-        with open('tilt.csv') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                number, blockers, greens, blues = row
-                if not number.startswith('#'):
-                    # Build a SIZE x SIZE array of pieces.
-                    board = []
-                    for _ in range(SIZE):
-                        board.append([' '] * SIZE)
-                    board[CENTER][CENTER] = TARGET
-                    _place_pieces(board, 'X', blockers)
-                    _place_pieces(board, 'G', greens)
-                    _place_pieces(board, 'B', blues)
-                    puzzles[int(number)] = board
-        return puzzles
+        return dict(Tilt.iter_puzzles(path))
 
     @staticmethod
     def print_actions(label: str, actions: List[Action]) -> None:
@@ -86,8 +292,9 @@ class Tilt:
             print('  ', Tilt.action_string(action))
 
     @staticmethod
-    def print_state(board: State) -> None:
+    def print_state(state: State) -> None:
         """Print a State."""
+        board = unpack_board(state)
         border = '+---' * SIZE + '+'
         for row in range(SIZE):
             print(border)
@@ -99,56 +306,45 @@ class Tilt:
         print(border)
 
     @staticmethod
-    def state_string(board: State) -> str:
-        """Get the string representation of a State."""
-        return str(board)
+    def puzzle_row(board: State) -> List[str]:
+        """Get the fields after the puzzle number that describe a State
+        in a puzzle file read by iter_puzzles:
+        the positions of the blockers, green pieces and blue pieces."""
+        width = coordinate_width(SIZE)
+        cells = unpack_board(board)
+        return [''.join(position_string((column + 1, row + 1), width)
+                        for row in range(SIZE) for column in range(SIZE)
+                        if cells[row][column] == piece)
+                for piece in 'XGB']
 
     @staticmethod
-    def take_action(board: State, direction: Action) -> State:
-        """Take an Action on a State and return a new State."""
+    def state_key(board: State) -> State:
+        """Get the value that identifies a State in a set of visited States."""
+        return board
 
-        # Make a deep copy of the state.
-        new_board = []
-        for row in range(SIZE):
-            new_board.append(board[row].copy())
+    @staticmethod
+    def state_string(board: State) -> str:
+        """Get the string representation of a State."""
+        return str(unpack_board(board))
 
-        forward = direction in ('R', 'D')
-        horizontal = direction in ('L', 'R')
+    @staticmethod
+    def take_action(
+            board: State, direction: Action, validate: bool = True) -> State:
+        """Take an Action on a State and return a new State.
+        Every tilt is possible, so validate is only accepted
+        for compatibility with the other games.
+        A tilt that would drop a blue piece in the hole changes nothing."""
+        for successor_direction, new_board in _successors(board):
+            if successor_direction == direction:
+                return new_board
+        return board
 
-        for index in range(SIZE):
-            # Create a vector of the pieces being considered
-            # where moves are from right to left.
-            vector = []
-            if horizontal:
-                row = index
-                vector = new_board[row]
-            else:
-                column = index
-                for row in range(SIZE):
-                    vector.append(new_board[row][column])
-            if forward:
-                vector.reverse()
-
-            valid = Tilt._process_vector(vector, direction)
-            if not valid:
-                return board
-
-            # Copy the vector to the new board
-            if forward:
-                vector.reverse()
-            if horizontal:
-                row = index
-                new_board[row] = vector
-            else:
-                column = index
-                for row in range(SIZE):
-                    new_board[row][column] = vector[row]
-
-        return new_board
-
-    @staticmethod
-    def _process_vector(vector: List[str], direction: str) -> bool:
+    @staticmethod
+    def _process_vector(vector: List[str]) -> bool:
         has_hole = TARGET in vector
+        # Lanes tilted right or down are reversed, so on boards
+        # of even size the hole is not at CENTER in them.
+        hole = vector.index(TARGET) if has_hole else -1
 
         # Move the pieces in the vector to the left.
         target = 0
@@ -159,13 +355,17 @@ class Tilt:
             # if index > target and (is_blue or is_green):
             if is_blue or is_green:
                 vector[index] = ' '
-                in_hole = has_hole and target <= CENTER < index
+                in_hole = has_hole and target <= hole < index
                 if not in_hole:
                     vector[target] = piece
                     target += 1
-                    Tilt.last_direction = direction
                 elif is_blue:  # not valid for blue to go in hole
                     return False
             elif piece == 'X':
                 target = index + 1
         return True
+
+
+# These are built once so tilts are done by table lookups.
+_spread = _make_spread()
+_tilt_tables = _make_tilt_tables()